@@ -1,19 +1,128 @@
-import os
+import hashlib
 import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
-from modules.pdf_text_extractor import extract_text_from_pdf
-from modules.text_cleaning import clean_text
-from modules.pdf_feature_extractor import extract_entities
-from modules.text_chunker import smart_chunk_text, save_chunks_to_json
-from modules.vector_database import save_to_faiss, search_faiss
+from modules.pipeline import STAGES, run_pipeline
+from modules.vector_database import stream_answer, get_retriever
+from modules import telemetry  # Spans & counters, on with TELEMETRY=1
 
 # 📌 Directories
 UPLOAD_DIR = "uploaded_pdfs"
 EXTRACTED_DIR = os.path.join(UPLOAD_DIR, "extracted")
+CORPUS_INDEX = os.path.join(EXTRACTED_DIR, "corpus.index")  # One index shared by every uploaded document
 os.makedirs(EXTRACTED_DIR, exist_ok=True)
+EXPORT_CHUNKS_JSON = os.environ.get("EXPORT_CHUNKS_JSON", "0") == "1"  # Debugging output only
+
+# 📌 Background processing
+# Streamlit reruns this script on every widget event, so an upload is processed once, in a background
+# job keyed by the PDF's content hash; reruns only read the job's progress or result, and questions
+# go straight to retrieval & the LLM. Jobs writing the corpus index take turns (see write_lock).
+PROCESSING_WORKERS = int(os.environ.get("PROCESSING_WORKERS", "1"))  # Uploads processed at the same time
+PROGRESS_REFRESH_SECONDS = 1.0
+
+stage_labels = {
+    "extract": "📄 Extracting text",
+    "clean": "🧹 Cleaning text",
+    "analyze": "📊 Extracting entities (financial, crypto, legal)",
+    "chunk": "🔹 Chunking text & generating embeddings with Nomic",
+    "index": "🗄️ Indexing chunks",
+}
+status_icons = {"pending": "⏳", "running": "🔄", "ran": "✅", "cached": "♻️", "skipped": "⏭️"}
+
+
+@st.cache_resource
+def processing_jobs():
+    """Jobs shared by every session of this server: {pdf_hash: job}, with the lock & pool that run them."""
+    return {"jobs": {}, "lock": threading.Lock(), "pool": ThreadPoolExecutor(max_workers=PROCESSING_WORKERS)}
+
+def start_processing(pdf_filename, pdf_bytes, pdf_hash):
+    """Returns the job processing this PDF, starting it unless it already ran, is running or failed
+    (a failed job is only restarted by `retry_processing`)."""
+    registry = processing_jobs()
+    with registry["lock"]:
+        job = registry["jobs"].get(pdf_hash)
+        if job is not None:
+            return job
+
+        # Named after the content, like the job: uploads that share a filename don't overwrite each other
+        doc_id = f"{pdf_hash[:12]}_{pdf_filename}"
+        pdf_path = os.path.join(UPLOAD_DIR, doc_id)
+        with open(pdf_path, "wb") as f:
+            f.write(pdf_bytes)
+
+        job = {"doc_id": doc_id, "stages": {stage: "pending" for stage in STAGES}, "started": time.perf_counter()}
+
+        def on_stage(stage, status):
+            job["stages"][stage] = status  # Runs on the worker thread: no Streamlit calls here
+
+        job["future"] = registry["pool"].submit(
+            run_pipeline,
+            pdf_path,
+            doc_id=doc_id,
+            index_path=CORPUS_INDEX,
+            output_dir=EXTRACTED_DIR,
+            export_chunks_json=EXPORT_CHUNKS_JSON,
+            on_stage=on_stage,
+        )
+        registry["jobs"][pdf_hash] = job
+        return job
+
+def retry_processing(pdf_hash):
+    """Forgets a failed job, so the next `start_processing` runs it again."""
+    registry = processing_jobs()
+    with registry["lock"]:
+        job = registry["jobs"].get(pdf_hash)
+        if job is not None and job["future"].done() and job["future"].exception() is not None:
+            del registry["jobs"][pdf_hash]
+
+def show_stages(job):
+    # Stages before the last finished one count as done: a stage whose output isn't needed
+    # (e.g. extract when the cleaned text is cached) never reports and is shown as skipped
+    finished = max((STAGES.index(stage) + 1 for stage, status in job["stages"].items() if status in ("ran", "cached")), default=0)
+    if not job["future"].done():
+        st.progress(finished / len(STAGES), text=f"Processing... {time.perf_counter() - job['started']:.0f} s")
+    for position, stage in enumerate(STAGES):
+        status = job["stages"][stage]
+        if status == "pending" and position < finished:
+            status = "skipped"
+        suffix = ": reused cached result" if status == "cached" else ""
+        st.write(f"{status_icons[status]} {stage_labels[stage]}{suffix}")
+
+@st.fragment(run_every=PROGRESS_REFRESH_SECONDS)
+def show_progress(job):
+    """Redraws only the progress panel until the job finishes, then reruns the page to show the result."""
+    if job["future"].done():
+        st.rerun()
+    show_stages(job)
+
+def show_telemetry():
+    """Sidebar panel: where processing & Q&A time went in this server process, plus exports."""
+    data = telemetry.snapshot()
+    with st.sidebar.expander("📈 Telemetry", expanded=False):
+        if not data["spans"] and not data["counters"]:
+            st.caption("Nothing recorded yet.")
+            return
+        st.dataframe(
+            [{"span": stats["name"], "labels": ", ".join(f"{key}={value}" for key, value in stats["labels"].items()),
+              "count": stats["count"], "self s": round(stats["self_seconds"], 3), "total s": round(stats["seconds"], 3),
+              "max s": round(stats["max_seconds"], 3), "errors": stats["errors"]} for stats in data["spans"]],
+            hide_index=True,
+        )
+        st.dataframe(
+            [{"counter": counter["name"], "labels": ", ".join(f"{key}={value}" for key, value in counter["labels"].items()),
+              "value": counter["value"]} for counter in data["counters"]],
+            hide_index=True,
+        )
+        st.download_button("⬇️ JSON", json.dumps(telemetry.snapshot(recent=True), indent=4), "telemetry.json")
+        st.download_button("⬇️ Prometheus", telemetry.to_prometheus(data), "telemetry.prom")
 
 # 🎨 Streamlit UI
 st.set_page_config(page_title="Crypto Due Diligence", layout="wide")
+if telemetry.enabled():
+    show_telemetry()
 
 st.title("📄 Crypto Due Diligence AI")
 st.markdown("🔍 Upload a **PDF** document to analyze its financial, crypto, and legal risks.")
@@ -23,75 +132,71 @@ uploaded_file = st.file_uploader("Upload your PDF", type=["pdf"])
 
 if uploaded_file is not None:
     pdf_filename = uploaded_file.name
-    pdf_path = os.path.join(UPLOAD_DIR, pdf_filename)
-
-    # Save uploaded file
-    with open(pdf_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
-
-    st.success(f"✅ File {pdf_filename} uploaded successfully!")
-
-    # 📌 Step 1: Extract Text
-    st.write("📄 Extracting text...")
-    extracted_text = extract_text_from_pdf(pdf_path)
-
-    # Save extracted text
-    text_file = os.path.join(EXTRACTED_DIR, f"{pdf_filename}.txt")
-    with open(text_file, "w", encoding="utf-8") as f:
-        f.write(extracted_text)
-
-    st.success("✅ Text extracted successfully!")
 
-    # 📌 Step 2: Clean Text
-    st.write("🧹 Cleaning text...")
-    cleaned_text = clean_text(extracted_text)
-    st.success("✅ Text cleaned!")
-
-    # 📌 Step 3: Extract Entities
-    st.write("📊 Extracting entities (financial, crypto, legal)...")
-    analysis_results = extract_entities(cleaned_text)
-
-    # Save analysis results
-    analysis_file = os.path.join(EXTRACTED_DIR, f"{pdf_filename}_analysis.json")
-    with open(analysis_file, "w", encoding="utf-8") as json_file:
-        json.dump(analysis_results, json_file, indent=4)
-
-    st.success("✅ Entity extraction completed!")
+    # Hash each upload once per session, not on every rerun
+    upload_hashes = st.session_state.setdefault("upload_hashes", {})
+    if uploaded_file.file_id not in upload_hashes:
+        upload_hashes[uploaded_file.file_id] = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+    pdf_hash = upload_hashes[uploaded_file.file_id]
+
+    # 📌 Steps 1-4: Extract, Clean, Analyze, Chunk & Embed, Index (in the background, once per PDF)
+    job = start_processing(pdf_filename, uploaded_file.getvalue(), pdf_hash)
+
+    if not job["future"].done():
+        st.info(f"⚙️ Processing {pdf_filename}... you can keep this page open, it updates by itself.")
+        show_progress(job)
+        st.stop()
+
+    if job["future"].exception() is not None:
+        error = job["future"].exception()
+        st.error(f"❌ Error processing {pdf_filename}: {type(error).__name__}: {error}")
+        if st.button("🔁 Retry"):
+            retry_processing(pdf_hash)
+            st.rerun()
+        st.stop()
+
+    result = job["future"].result()
+    doc_id = job["doc_id"]
+    st.success(f"✅ Document processed: {result['chunks']} chunks indexed!")
+    with st.expander("⏱️ Processing stages"):
+        show_stages(job)
 
     # 📌 Display Extracted Entities
     st.subheader("📌 Extracted Entities")
-    st.json(analysis_results)
-
-    # 📌 Step 4: Chunking & Embedding
-    st.write("🔹 Chunking text & generating embeddings with Nomic...")
-    chunks = smart_chunk_text(cleaned_text)
+    st.json(result["analysis"])
 
-    # Save chunks
-    chunk_file = os.path.join(EXTRACTED_DIR, f"{pdf_filename}_chunks.json")
-    save_chunks_to_json(chunks, chunk_file)
+    # 📌 Warm retriever: index & metadata stay loaded across questions and sessions
+    get_retriever(CORPUS_INDEX)
 
-    # Save embeddings to FAISS
-    index_file = os.path.join(EXTRACTED_DIR, f"{pdf_filename}_embeddings.index")
-    save_to_faiss(chunks, index_path=index_file)
-
-    st.success("✅ Chunking & Embeddings saved!")
-
-    # 📌 Enable Q&A
+    # 📌 Enable Q&A (a form: typing & switching the scope don't rerun anything until Search)
     st.subheader("🧐 Ask Questions About the Document")
-    user_query = st.text_input("Type your question:")
+    with st.form("qa"):
+        user_query = st.text_input("Type your question:")
+        search_scope = st.radio("Search in:", ["This document", "All uploaded documents"], horizontal=True)
+        submitted = st.form_submit_button("🔍 Search")
 
-    if st.button("🔍 Search"):
+    if submitted:
         if user_query:
-            results = search_faiss(user_query, k=5, index_path=index_file)
+            doc_ids = [doc_id] if search_scope == "This document" else None
 
-            # ✅ **Ensure Correct Formatting for Display**
+            # ✅ Stream the answer as the LLM generates it
             st.subheader("📌 Top Answers from Document")
-            if isinstance(results, str):
-                st.markdown(f"**Answer:** {results}")  # ✅ Ensure correct response format
-            elif isinstance(results, list) and results:
-                formatted_text = " ".join(results)  # ✅ Join text properly for readability
-                st.markdown(f"**Answer:** {formatted_text}")
-            else:
+            st.markdown("**Answer:**")
+            timings = {}  # This question's latencies (the retriever is shared with other sessions)
+            answer = st.write_stream(stream_answer(user_query, k=5, index_path=CORPUS_INDEX, doc_ids=doc_ids,
+                                                   timings=timings))
+            if not answer:
                 st.warning("⚠️ No relevant answers found. Try another question.")
+
+            if timings:
+                st.caption(
+                    f"⏱️ First token {timings.get('ttft_ms', 0):.0f} ms · "
+                    f"total {timings.get('total_ms', 0):.0f} ms · "
+                    f"query embedding {timings.get('embed_ms', 0):.0f} ms · "
+                    f"search {timings.get('search_ms', 0) + timings.get('lexical_ms', 0):.1f} ms "
+                    f"({timings.get('retrieval', 'dense')}) · "
+                    f"context {timings.get('context_tokens', 0)} tokens from {timings.get('chunks_used', 0)} chunks"
+                    f" ({timings.get('duplicates_dropped', 0)} near-duplicates dropped)"
+                )
         else:
             st.warning("⚠️ Please enter a question.")
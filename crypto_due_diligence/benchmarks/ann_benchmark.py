@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+import sys
+import time
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Run from anywhere
+
+from modules.index_factory import INDEX_TYPES, build_index, export_vectors, index_bytes, search_params
+
+# Compares the ANN index types against exact search on real (or synthetic) corpus vectors:
+#   python benchmarks/ann_benchmark.py --index test_pdfs/extracted/embeddings.index
+#   python benchmarks/ann_benchmark.py --synthetic 200000 --types ivf_flat,hnsw,ivf_sq8 --json ann.json
+
+def load_vectors(args):
+    """Corpus vectors from an existing index, or clustered random vectors of the Nomic width."""
+    if args.index:
+        vectors, _ = export_vectors(faiss.read_index(args.index))
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+
+    rng = np.random.default_rng(args.seed)
+    centers = rng.normal(size=(max(1, args.synthetic // 500), args.dim)).astype(np.float32)
+    vectors = centers[rng.integers(len(centers), size=args.synthetic)]
+    vectors += 0.3 * rng.normal(size=vectors.shape).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def make_queries(vectors, n_queries, seed):
+    """Perturbed copies of corpus vectors, so each query has realistic near neighbours."""
+    rng = np.random.default_rng(seed + 1)
+    queries = vectors[rng.choice(len(vectors), min(n_queries, len(vectors)), replace=False)].copy()
+    queries += 0.05 * rng.normal(size=queries.shape).astype(np.float32)
+    return queries
+
+def recall_at_k(found, truth):
+    """Fraction of the exact top-k neighbours each ANN result recovered, averaged over queries."""
+    k = truth.shape[1]
+    return float(np.mean([len(set(f[f >= 0]) & set(t)) / k for f, t in zip(found, truth)]))
+
+def benchmark(index_type, vectors, ids, queries, truth, k, nlist, pq_m, nprobe, ef_search):
+    start = time.perf_counter()
+    index = build_index(index_type, vectors, ids, nlist=nlist, pq_m=pq_m)
+    build_seconds = time.perf_counter() - start
+    params = search_params(index, nprobe=nprobe, ef_search=ef_search)
+
+    latencies = []
+    found = []
+    for query in queries:  # One query at a time, like the interactive Q&A path
+        start = time.perf_counter()
+        _, labels = index.search(query.reshape(1, -1), k, params=params)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found.append(labels[0])
+
+    return {
+        "index_type": index_type,
+        "vectors": int(index.ntotal),
+        f"recall@{k}": round(recall_at_k(np.array(found), truth), 4),
+        "latency_ms_p50": round(float(np.percentile(latencies, 50)), 4),
+        "latency_ms_p95": round(float(np.percentile(latencies, 95)), 4),
+        "bytes_per_vector": round(index_bytes(index) / max(index.ntotal, 1), 1),
+        "build_seconds": round(build_seconds, 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall / latency / memory of FAISS index types.")
+    parser.add_argument("--index", help="Existing corpus index to take vectors from")
+    parser.add_argument("--synthetic", type=int, default=100000, help="Synthetic vectors if no --index")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--types", default=",".join(INDEX_TYPES), help="Comma-separated index types")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--pq-m", type=int, default=64)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    vectors = load_vectors(args)
+    ids = np.arange(len(vectors), dtype=np.int64)
+    queries = make_queries(vectors, args.queries, args.seed)
+
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+
+    results = []
+    for index_type in args.types.split(","):
+        result = benchmark(index_type.strip(), vectors, ids, queries, truth, args.k,
+                           args.nlist, args.pq_m, args.nprobe, args.ef_search)
+        results.append(result)
+        print(json.dumps(result))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"vectors": len(vectors), "dim": int(vectors.shape[1]), "k": args.k,
+                       "nprobe": args.nprobe, "ef_search": args.ef_search, "results": results}, f, indent=4)
+        print(f"✅ Results saved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Measures what importing each pipeline module costs in a fresh interpreter (wall time and
+# peak RSS), and optionally what loading the shared NLP models costs on first use:
+#   python benchmarks/import_profile.py
+#   python benchmarks/import_profile.py --with-models --json import_profile.json
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = (
+    "modules.pdf_text_extractor",
+    "modules.text_cleaning",
+    "modules.pdf_feature_extractor",
+    "modules.text_chunker",
+    "modules.vector_database",
+)
+
+PROBE = """
+import json, resource, sys, time
+baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+__import__(sys.argv[1])
+imported = time.perf_counter()
+result = {"module": sys.argv[1], "import_seconds": imported - start,
+          "import_rss_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline) / 1024}
+if sys.argv[2] == "1":
+    from modules.nlp_models import get_spacy_model, get_sentiment_analyzer, get_tokenizer
+    get_spacy_model(); get_sentiment_analyzer(); get_tokenizer()
+    result["models_seconds"] = time.perf_counter() - imported
+    result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+print(json.dumps(result))
+"""
+
+def profile(module, with_models=False):
+    """Imports `module` in a fresh interpreter and returns its timings."""
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE, module, "1" if with_models else "0"],
+        cwd=PROJECT_DIR, capture_output=True, text=True,
+    )
+    if output.returncode != 0:
+        return {"module": module, "error": output.stderr.strip().splitlines()[-1]}
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time / RSS of the pipeline modules.")
+    parser.add_argument("--with-models", action="store_true", help="Also load the shared NLP models")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    results = [profile(module, args.with_models) for module in MODULES]
+    for result in results:
+        print(json.dumps(result))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+        print(f"✅ Results saved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import fitz  # PyMuPDF
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Run from anywhere
+
+# Measure the work itself, not cache hits (read when the modules are imported)
+os.environ["EMBEDDING_CACHE_PATH"] = ""
+os.environ["ANSWER_CACHE_PATH"] = ""
+
+from tests.fake_ollama import FakeOllamaServer
+from modules.embeddings import get_client
+from modules.pdf_text_extractor import extract_pages
+from modules.text_cleaning import clean_pages, clean_text
+from modules.pdf_feature_extractor import extract_entities_from_pages
+from modules.text_chunker import smart_chunk_text
+from modules.vector_database import save_to_faiss, search_faiss
+
+# End-to-end benchmark of the pipeline stages on synthetic PDFs, fully offline: Ollama is replaced by
+# the deterministic fake server (fixed embeddings & answers, configurable latency), so runs are
+# comparable between commits. Reports per-stage seconds, throughput and peak traced memory as JSON:
+#   python benchmarks/pipeline_benchmark.py
+#   python benchmarks/pipeline_benchmark.py --pages 200 --scanned-pages 10 --embed-latency 0.05 --json bench.json
+#   python benchmarks/pipeline_benchmark.py --json new.json --baseline bench.json
+# Scanned pages need Tesseract & Poppler, like the real OCR path; spaCy models must be installed.
+
+COMPANIES = ("Acme Digital Assets Ltd", "Northwind Custody Inc", "Blue Harbor Capital LLC", "Kestrel Exchange GmbH")
+PEOPLE = ("Maria Lopez", "James Chen", "Amelia Novak", "Daniel Okafor")
+TERMS = ("revenue", "liability", "funding", "equity", "derivative", "Bitcoin", "Ethereum", "Tether", "DeFi",
+         "staking", "SEC", "AML", "KYC", "MiCA", "OFAC", "fraud", "lawsuit", "money laundering")
+SENTENCES = (
+    "{company} reported {term} exposure of ${amount} million for the fiscal year.",
+    "According to {person}, the {term} controls of {company} were reviewed by the auditors.",
+    "The board of {company} disclosed a pending {term} matter involving its custody business.",
+    "Contact {email} or call +1 212 555 {digits} for questions about {term} reporting.",
+    "{company} (CIK {cik}) holds client assets at address 0x{address} under {term} rules.",
+    "Management expects {term} requirements to affect liquidity, staking yields and treasury operations.",
+)
+QUESTIONS = (
+    "What are the main regulatory risks?",
+    "Who are the directors of {company}?",
+    "How much {term} exposure was reported?",
+    "Is there any pending lawsuit or fraud allegation?",
+    "{term}",
+)
+
+def synthetic_text(rng, words):
+    """Due-diligence-like prose with companies, people, amounts, emails, CIKs & lexicon terms."""
+    sentences = []
+    count = 0
+    while count < words:
+        sentence = rng.choice(SENTENCES).format(
+            company=rng.choice(COMPANIES), person=rng.choice(PEOPLE), term=rng.choice(TERMS),
+            amount=rng.randint(1, 900), digits=rng.randint(1000, 9999), cik=f"{rng.randint(0, 10**10 - 1):010d}",
+            email=f"{rng.choice(PEOPLE).split()[0].lower()}@example.com", address=f"{rng.getrandbits(160):040x}",
+        )
+        sentences.append(sentence)
+        count += len(sentence.split())
+    return " ".join(sentences)
+
+def write_pdf(path, rng, pages, words_per_page, scanned=False, dpi=150):
+    """Writes a synthetic PDF; scanned pages are rendered to images, so they have no text layer."""
+    with fitz.open() as doc:
+        for _ in range(pages):
+            page = doc.new_page()
+            page.insert_textbox(page.rect + (50, 50, -50, -50), synthetic_text(rng, words_per_page), fontsize=9)
+            if scanned:
+                image = page.get_pixmap(dpi=dpi)
+                doc.delete_page(page.number)
+                page = doc.new_page()
+                page.insert_image(page.rect, pixmap=image)
+        doc.save(path)
+    return path
+
+def measure(stage, fn, items_of=None, unit=None, memory=True):
+    """Runs one stage; returns (result, record with seconds, throughput & peak traced memory).
+
+    tracemalloc slows Python-heavy stages several times over, so the peak is taken from a second,
+    traced run of the stage and the timing from the untraced first one.
+    """
+    record = {"stage": stage}
+    start = time.perf_counter()
+    try:
+        result = fn()
+    except Exception as e:
+        result = None
+        record["error"] = f"{type(e).__name__}: {e}"
+    seconds = time.perf_counter() - start
+    record["seconds"] = round(seconds, 4)
+    if "error" in record:
+        return result, record
+
+    if items_of is not None:
+        items = items_of(result)
+        record.update(items=items, unit=unit, per_second=round(items / seconds, 2) if seconds else 0.0)
+    if memory:
+        tracemalloc.start()
+        try:
+            fn()
+            record["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+        finally:
+            tracemalloc.stop()
+    return result, record
+
+def query_latencies(queries, k, index_path, doc_id):
+    """Answers each query (retrieval + streamed fake LLM) and returns the per-query latencies in ms."""
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        search_faiss(query, k=k, index_path=index_path, doc_ids=[doc_id])
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+def benchmark_document(kind, pdf_path, index_path, queries, args):
+    """Every stage of the pipeline on one PDF, each timed on the previous stage's output."""
+    memory = not args.no_memory
+    stages = []
+
+    pages, record = measure("extract", lambda: extract_pages(pdf_path, max_workers=args.ocr_workers),
+                            len, "pages", memory)
+    stages.append(record)
+    if not pages:
+        return {"kind": kind, "path": pdf_path, "stages": stages}
+
+    cleaned, record = measure("clean_text", lambda: list(clean_pages(pages)),
+                              len, "pages", memory)
+    stages.append(record)
+    text = "\n".join(page_text for _, page_text in cleaned or pages)
+
+    # As in the pipeline: terms on the raw pages, everything else on the cleaned ones
+    _, record = measure("extract_entities", lambda: extract_entities_from_pages(pages, clean=clean_text),
+                        lambda _: len(pages), "pages", memory)
+    stages.append(record)
+
+    chunks, record = measure("smart_chunk_text", lambda: smart_chunk_text(text, max_tokens=args.max_tokens),
+                             len, "chunks", memory)
+    stages.append(record)
+    if not chunks:
+        return {"kind": kind, "path": pdf_path, "pages": len(pages), "stages": stages}
+
+    _, record = measure("save_to_faiss", lambda: save_to_faiss(chunks, index_path, doc_id=kind),
+                        lambda _: len(chunks), "chunks", memory)
+    stages.append(record)
+
+    latencies, record = measure("search_faiss", lambda: query_latencies(queries, args.k, index_path, kind),
+                                len, "queries", memory)
+    if latencies:
+        record.update(latency_ms_p50=round(float(np.percentile(latencies, 50)), 2),
+                      latency_ms_p95=round(float(np.percentile(latencies, 95)), 2))
+    stages.append(record)
+
+    total = sum(stage["seconds"] for stage in stages)
+    return {"kind": kind, "path": pdf_path, "pages": len(pages), "chunks": len(chunks),
+            "seconds": round(total, 4), "pages_per_second": round(len(pages) / total, 2) if total else 0.0,
+            "stages": stages}
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(results, baseline):
+    """Prints each stage's time relative to a previous run (> 1.00x is slower)."""
+    previous = {(document["kind"], stage["stage"]): stage for document in baseline["documents"] for stage in document["stages"]}
+    print(f"📊 Compared with {baseline.get('commit') or 'baseline'}:")
+    for document in results["documents"]:
+        for stage in document["stages"]:
+            before = previous.get((document["kind"], stage["stage"]))
+            if before and before.get("seconds") and "error" not in stage:
+                ratio = stage["seconds"] / before["seconds"]
+                flag = " ⚠️" if ratio > 1.1 else ""
+                print(f"  {document['kind']:8} {stage['stage']:17} {before['seconds']:9.3f} s -> {stage['seconds']:9.3f} s "
+                      f"({ratio:.2f}x){flag}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-stage timings, throughput & peak memory of the pipeline.")
+    parser.add_argument("--pages", type=int, default=20, help="Pages of the digital PDF")
+    parser.add_argument("--scanned-pages", type=int, default=2, help="Pages of the scanned PDF (0 skips it)")
+    parser.add_argument("--words-per-page", type=int, default=400)
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="Fake Ollama seconds per request")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Fake Ollama seconds per answer word")
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--max-tokens", type=int, default=600)
+    parser.add_argument("--ocr-workers", type=int, default=None)
+    parser.add_argument("--no-memory", action="store_true", help="Skip the traced second run of each stage (peak memory)")
+    parser.add_argument("--workdir", help="Where to write the PDFs & index (default: a temporary directory)")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--json", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Previous --json output to compare the stage timings with")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="pipeline_benchmark_")
+    os.makedirs(workdir, exist_ok=True)
+    rng = random.Random(args.seed)
+    queries = [rng.choice(QUESTIONS).format(company=rng.choice(COMPANIES), term=rng.choice(TERMS))
+               for _ in range(args.queries)]
+    documents = [("digital", args.pages, False), ("scanned", args.scanned_pages, True)]
+    pdfs = [(kind, write_pdf(os.path.join(workdir, f"{kind}.pdf"), rng, pages, args.words_per_page, scanned))
+            for kind, pages, scanned in documents if pages > 0]
+    index_path = os.path.join(workdir, "benchmark.index")
+
+    with FakeOllamaServer(latency=args.embed_latency, token_latency=args.token_latency) as server:
+        os.environ["OLLAMA_HOST"] = server.url
+        results = {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {key: value for key, value in vars(args).items() if key not in ("json", "baseline")},
+            "documents": [],
+        }
+        for kind, pdf_path in pdfs:
+            document = benchmark_document(kind, pdf_path, index_path, queries, args)
+            results["documents"].append(document)
+            for stage in document["stages"]:
+                print(json.dumps({"kind": kind, **stage}))
+        results["ollama"] = get_client().stats()
+        results["fake_ollama_requests"] = len(server.requests)
+    results["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+        print(f"✅ Results saved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from modules.pipeline import embed_document, index_document, prepare_document, record_indexed
+from modules.pipeline_cache import file_hash
+from modules import telemetry
+from modules.vector_database import CorpusIndex, DEFAULT_INDEX_PATH
+
+# Batch ingest of a whole data room into one corpus index, as a staged worker pipeline:
+#   file workers (processes)  extract, OCR, clean, NER & chunk one PDF each (cached per stage)
+#   embedders (threads)       embed the new chunks; Ollama calls overlap
+#   one writer (thread)       adds documents to the corpus index, saves it and the manifest
+# Stages are connected by bounded queues, so a slow stage holds the others back instead of
+# piling documents up in memory. A failing file is recorded in the manifest and skipped.
+#   python ingest.py data_room/
+#   python ingest.py "data_room/**/*.pdf" --index data_room/extracted/corpus.index --workers 8
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+EMBED_CONCURRENCY = int(os.environ.get("EMBED_CONCURRENCY", "4"))  # Documents embedded at the same time
+QUEUE_SIZE = 8  # Documents waiting between two stages
+SAVE_EVERY = 25  # Documents added between index (and manifest) saves
+# File workers are fresh interpreters: forked ones would copy the parent's embedder & writer threads'
+# locks (Ollama client, SQLite, queues) in whatever state they were, and can deadlock on them
+WORKER_START_METHOD = "spawn"
+
+def find_pdfs(source):
+    """PDFs under a directory (recursively), or matching a glob; returns (root, sorted paths)."""
+    if os.path.isdir(source):
+        paths = [
+            os.path.join(directory, filename)
+            for directory, _, filenames in os.walk(source)
+            for filename in filenames
+            if filename.lower().endswith(".pdf")
+        ]
+        return source, sorted(paths)
+    paths = sorted(path for path in glob.glob(source, recursive=True) if path.lower().endswith(".pdf"))
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths]) if paths else "."
+    return root, paths
+
+def doc_id_for(path, root):
+    """Document id: the path relative to the ingested root, without extension (unique within a data room)."""
+    return os.path.splitext(os.path.relpath(os.path.abspath(path), os.path.abspath(root)))[0].replace(os.sep, "/")
+
+def manifest_path_for(index_path):
+    """Ingest manifest stored next to the index: `<index base>_manifest.json`."""
+    return os.path.splitext(index_path)[0] + "_manifest.json"
+
+def load_manifest(path):
+    """{doc_id: record} of previous runs (empty if there's none yet); each record holds the file's pdf_hash."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    for key, record in list(manifest.items()):  # Older manifests were keyed by pdf_hash
+        if "pdf_hash" not in record:
+            del manifest[key]
+            manifest[record.get("doc_id") or record["path"]] = {**record, "pdf_hash": key if key != record["path"] else None}
+    return manifest
+
+def save_manifest(manifest, path):
+    """Writes the manifest atomically, so an interrupted run never leaves it half-written."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(tmp_path, path)
+
+def _prepare(path, doc_id, index_path, output_dir, max_tokens, ocr_workers):
+    """File worker: every stage up to chunking, embeddings left to the embedders."""
+    prepared = prepare_document(path, doc_id, index_path=index_path, output_dir=output_dir, max_tokens=max_tokens,
+                                embed=False, ocr_workers=ocr_workers)
+    prepared["risk_score"] = prepared.pop("analysis").get("risk_score")  # Only this goes back to the parent
+    if telemetry.enabled():  # The worker's spans & counters since its last document, merged by the parent
+        prepared["telemetry"] = telemetry.snapshot()
+        telemetry.reset()
+    return prepared
+
+def ingest(source, index_path=DEFAULT_INDEX_PATH, output_dir=None, workers=INGEST_WORKERS,
+           embed_concurrency=EMBED_CONCURRENCY, ocr_workers=1, max_tokens=600, retry_failed=True):
+    """
+    Ingests every PDF of `source` (directory or glob) into the corpus index at `index_path`.
+    Files already ingested with the same content (per the manifest) are skipped, so an interrupted
+    run resumes where it stopped; files that failed are retried unless `retry_failed` is False.
+    :return: Run summary (files, pages, chunks, elapsed seconds, pages/s, chunks/s)
+    """
+    root, paths = find_pdfs(source)
+    os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+    manifest_path = manifest_path_for(index_path)
+    manifest = load_manifest(manifest_path)
+    totals = {"files": len(paths), "ingested": 0, "skipped": 0, "failed": 0, "pages": 0, "chunks": 0}
+    start = time.perf_counter()
+
+    prepared_queue = queue.Queue(maxsize=QUEUE_SIZE)  # File workers -> embedders
+    embedded_queue = queue.Queue(maxsize=QUEUE_SIZE)  # Embedders -> writer
+    done = object()
+
+    def failure(path, pdf_hash, doc_id, error):
+        return {"failed": True, "path": path, "pdf_hash": pdf_hash, "doc_id": doc_id,
+                "error": f"{type(error).__name__}: {error}"}
+
+    def embedder():
+        while True:
+            item = prepared_queue.get()
+            if item is done:
+                return
+            if not item.get("failed"):
+                try:
+                    embed_document(item)
+                except Exception as e:
+                    item = failure(item["path"], item["pdf_hash"], item["doc_id"], e)
+            embedded_queue.put(item)
+
+    def writer():
+        try:
+            write_documents()
+        except Exception as e:  # e.g. the index can't be opened: keep draining so the other stages finish
+            print(f"❌ Index writer stopped: {type(e).__name__}: {e}")
+            totals["error"] = f"{type(e).__name__}: {e}"
+            while embedded_queue.get() is not done:
+                pass
+
+    def write_documents():
+        pending = []  # Added to the index, not saved yet
+
+        def checkpoint():
+            corpus.save()
+            for prepared in pending:
+                record_indexed(prepared)
+                manifest[prepared["doc_id"]] = {
+                    "path": prepared["path"], "doc_id": prepared["doc_id"], "pdf_hash": prepared["pdf_hash"],
+                    "status": "done", "pages": prepared["pages"], "chunks": prepared["chunk_count"],
+                    "risk_score": prepared["risk_score"], "stages": prepared["status"],
+                }
+            pending.clear()
+            save_manifest(manifest, manifest_path)
+
+        with CorpusIndex(index_path) as corpus:
+            while True:
+                item = embedded_queue.get()
+                if item is done:
+                    break
+                if not item.get("failed"):
+                    try:
+                        index_document(item, corpus=corpus)
+                    except Exception as e:
+                        item = failure(item["path"], item["pdf_hash"], item["doc_id"], e)
+                if item.get("failed"):
+                    totals["failed"] += 1
+                    telemetry.count("ingest_failures")
+                    manifest[item["doc_id"] or item["path"]] = {
+                        "path": item["path"], "doc_id": item["doc_id"], "pdf_hash": item["pdf_hash"],
+                        "status": "failed", "error": item["error"],
+                    }
+                    save_manifest(manifest, manifest_path)
+                    print(f"❌ {item['path']}: {item['error']}")
+                    continue
+
+                totals["ingested"] += 1
+                totals["pages"] += item["pages"]
+                totals["chunks"] += item["chunk_count"] if item["status"].get("index") == "ran" else 0
+                pending.append(item)
+                print(f"✅ {item['doc_id']}: {item['pages']} pages extracted, {item['chunk_count']} chunks "
+                      f"(index {item['status'].get('index')})")
+                if len(pending) >= SAVE_EVERY:
+                    checkpoint()
+            if pending:
+                checkpoint()
+
+    embedders = [threading.Thread(target=embedder, daemon=True) for _ in range(embed_concurrency)]
+    writer_thread = threading.Thread(target=writer, daemon=True)
+    for thread in embedders + [writer_thread]:
+        thread.start()
+
+    # File workers: at most 2 x `workers` files in flight; a full queue blocks new submissions
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(WORKER_START_METHOD)) as pool:
+        in_flight = {}
+
+        def collect(futures):
+            for future in futures:
+                path, pdf_hash, doc_id = in_flight.pop(future)
+                try:
+                    prepared = future.result()
+                    prepared.update(path=path, pdf_hash=pdf_hash)
+                    telemetry.merge(prepared.pop("telemetry", {}))
+                except Exception as e:
+                    prepared = failure(path, pdf_hash, doc_id, e)
+                prepared_queue.put(prepared)
+
+        for path in paths:
+            try:
+                pdf_hash = file_hash(path)
+            except OSError as e:
+                prepared_queue.put(failure(path, None, None, e))
+                continue
+            doc_id = doc_id_for(path, root)
+            record = manifest.get(doc_id)
+            if record and record["pdf_hash"] == pdf_hash and (
+                record["status"] == "done" or (record["status"] == "failed" and not retry_failed)
+            ):
+                totals["skipped"] += 1
+                continue
+
+            future = pool.submit(_prepare, path, doc_id, index_path, output_dir, max_tokens, ocr_workers)
+            in_flight[future] = (path, pdf_hash, doc_id)
+            if len(in_flight) >= 2 * workers:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(finished)
+        collect(list(in_flight))
+
+    for _ in embedders:
+        prepared_queue.put(done)
+    for thread in embedders:
+        thread.join()
+    embedded_queue.put(done)
+    writer_thread.join()
+
+    elapsed = time.perf_counter() - start
+    totals.update(
+        seconds=round(elapsed, 2),
+        pages_per_second=round(totals["pages"] / elapsed, 2) if elapsed else 0.0,
+        chunks_per_second=round(totals["chunks"] / elapsed, 2) if elapsed else 0.0,
+    )
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest a directory (or glob) of PDFs into the corpus index.")
+    parser.add_argument("source", help="Directory (searched recursively) or glob, e.g. 'data_room/**/*.pdf'")
+    parser.add_argument("--index", default=DEFAULT_INDEX_PATH, help="Corpus index to add the documents to")
+    parser.add_argument("--output-dir", help="Also write each document's .txt & _analysis.json here")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="File worker processes")
+    parser.add_argument("--embed-concurrency", type=int, default=EMBED_CONCURRENCY, help="Documents embedded concurrently")
+    parser.add_argument("--ocr-workers", type=int, default=1, help="OCR processes per file worker")
+    parser.add_argument("--max-tokens", type=int, default=600, help="Chunk size in tokens")
+    parser.add_argument("--skip-failed", action="store_true", help="Don't retry files that failed in a previous run")
+    parser.add_argument("--json", help="Write the run summary to this JSON file")
+    parser.add_argument("--telemetry", default=telemetry.TELEMETRY_EXPORT,
+                        help="Write per-stage spans & counters here (.prom: Prometheus text, else JSON)")
+    args = parser.parse_args()
+    if args.telemetry:
+        os.environ["TELEMETRY"] = "1"  # File worker processes read it when they import the modules
+        telemetry.enable()
+
+    summary = ingest(args.source, index_path=args.index, output_dir=args.output_dir, workers=args.workers,
+                     embed_concurrency=args.embed_concurrency, ocr_workers=args.ocr_workers,
+                     max_tokens=args.max_tokens, retry_failed=not args.skip_failed)
+    print(f"🎯 {summary['ingested']} ingested, {summary['skipped']} already done, {summary['failed']} failed "
+          f"of {summary['files']} files in {summary['seconds']} s "
+          f"({summary['pages_per_second']} pages/s, {summary['chunks_per_second']} chunks/s)")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=4)
+        print(f"✅ Summary saved to {args.json}")
+
+    if args.telemetry:
+        for line in telemetry.summary_lines():
+            print(f"📈 {line}")
+        telemetry.export(args.telemetry)
+        print(f"✅ Telemetry saved to {args.telemetry}")
+
+
+if __name__ == "__main__":
+    main()
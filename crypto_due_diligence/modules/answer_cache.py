@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import numpy as np
+
+# On-disk cache of LLM answers (SQLite). An answer is reused when the index is unchanged and either
+#   - the normalized question is the same (served without embedding the question), or
+#   - the question's embedding is within ANSWER_SIMILARITY (cosine) of a cached question's and
+#     retrieval returned the same chunks ("who are the directors?" vs "who are the company's directors")
+# Entries expire after ANSWER_CACHE_TTL seconds; beyond ANSWER_CACHE_MAX_ENTRIES the least recently
+# used go. Answers of an index version are dropped as soon as a newer version of that index is seen.
+ANSWER_CACHE_PATH = os.environ.get("ANSWER_CACHE_PATH", os.path.join(".cache", "answers.sqlite"))  # "" disables
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", str(7 * 24 * 3600)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "10000"))
+ANSWER_SIMILARITY = float(os.environ.get("ANSWER_SIMILARITY", "0.95"))
+
+def normalize_query(query):
+    """Lowercased, single-spaced question without trailing punctuation."""
+    return re.sub(r"\s+", " ", query).strip().lower().rstrip("?!. ")
+
+def scope_key(index_path, **settings):
+    """What else an answer depends on: the index and the search settings (doc filter, k, budget, model)."""
+    payload = json.dumps({"index": os.path.abspath(index_path), **settings}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _unit(embedding):
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class AnswerCache:
+    """Persistent answer cache with exact & near-duplicate question lookup, TTL, LRU and invalidation."""
+
+    def __init__(self, path=ANSWER_CACHE_PATH, ttl=ANSWER_CACHE_TTL, max_entries=ANSWER_CACHE_MAX_ENTRIES,
+                 similarity=ANSWER_SIMILARITY):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        self._versions = {}  # index path -> latest version seen by this process
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " id INTEGER PRIMARY KEY, index_path TEXT NOT NULL, version TEXT NOT NULL, scope TEXT NOT NULL,"
+            " query TEXT NOT NULL, chunk_ids TEXT NOT NULL, embedding BLOB, answer TEXT NOT NULL,"
+            " created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_query ON answers (version, scope, query)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_chunks ON answers (version, scope, chunk_ids)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)")
+        self._conn.commit()
+
+    def _invalidate_stale(self, index_path, version):
+        """Drops answers computed against older versions of an index (once per version change)."""
+        if self._versions.get(index_path) != version:
+            deleted = self._conn.execute(
+                "DELETE FROM answers WHERE index_path = ? AND version != ?", (index_path, version)
+            ).rowcount
+            self._conn.commit()
+            self.invalidated += deleted
+            self._versions[index_path] = version
+
+    def _use(self, row_id):
+        self._conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (time.time(), row_id))
+        self._conn.commit()
+
+    def get_exact(self, index_path, version, scope, query):
+        """Cached answer for the same normalized question, as (answer, chunk_ids), or None."""
+        with self._lock:
+            self._invalidate_stale(index_path, version)
+            row = self._conn.execute(
+                "SELECT id, answer, chunk_ids FROM answers WHERE version = ? AND scope = ? AND query = ? AND created > ?"
+                " ORDER BY last_used DESC LIMIT 1",
+                (version, scope, normalize_query(query), time.time() - self.ttl),
+            ).fetchone()
+            if row is None:
+                return None
+            self._use(row[0])
+            self.exact_hits += 1
+        return row[1], json.loads(row[2])
+
+    def get_similar(self, version, scope, chunk_ids, query_embedding):
+        """Cached answer of a near-duplicate question that retrieved the same chunks, or None."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, answer, embedding FROM answers WHERE version = ? AND scope = ? AND chunk_ids = ?"
+                " AND created > ? AND embedding IS NOT NULL",
+                (version, scope, json.dumps(chunk_ids), time.time() - self.ttl),
+            ).fetchall()
+            best, best_similarity = None, self.similarity
+            query = _unit(query_embedding)
+            for row_id, answer, embedding in rows:
+                similarity = float(np.dot(query, np.frombuffer(embedding, dtype=np.float32)))
+                if similarity >= best_similarity:
+                    best, best_similarity = (row_id, answer), similarity
+            if best is None:
+                self.misses += 1
+                return None
+            self._use(best[0])
+            self.semantic_hits += 1
+        return best[1]
+
+    def put(self, index_path, version, scope, query, chunk_ids, query_embedding, answer):
+        """Stores an answer, then evicts expired and least-recently-used entries over the limit."""
+        now = time.time()
+        embedding = _unit(query_embedding).tobytes() if query_embedding is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO answers (index_path, version, scope, query, chunk_ids, embedding, answer, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (index_path, version, scope, normalize_query(query), json.dumps(chunk_ids), embedding, answer, now, now),
+            )
+            self._conn.execute("DELETE FROM answers WHERE created <= ?", (now - self.ttl,))
+            overflow = self._count() - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM answers WHERE id IN (SELECT id FROM answers ORDER BY last_used ASC LIMIT ?)",
+                    (overflow,),
+                )
+            self._conn.commit()
+
+    def _count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+    def stats(self):
+        """Hit/miss counters for this process plus the current number of cached answers."""
+        with self._lock:
+            entries = self._count()
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+            "invalidated": self.invalidated,
+            "entries": entries,
+            "max_entries": self.max_entries,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache = None
+
+def get_answer_cache():
+    """Returns the process-wide answer cache, or None when disabled with ANSWER_CACHE_PATH=''."""
+    global _default_cache
+    if _default_cache is None and ANSWER_CACHE_PATH:
+        _default_cache = AnswerCache()
+    return _default_cache
@@ -0,0 +1,233 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import numpy as np
+
+# Compact chunk metadata store (SQLite) kept next to each FAISS index.
+# Embeddings live in the index (and the embedding cache); only vectors added since the index file was
+# last written are kept here (pending_vectors), with the ids removed from it since (removed_vectors).
+STORE_MMAP_SIZE = 256 * 1024 * 1024  # Bytes of the store read-only readers map instead of copying
+CHUNK_COLUMNS = ("doc_id", "chunk_id", "text", "tokens", "start_char", "end_char", "page_start", "page_end")
+LEXICAL_TOKEN_REGEX = re.compile(r"\w+")  # Same word split as the FTS5 unicode61 tokenizer
+
+def chunk_store_path_for(index_path):
+    """Path of the chunk store that belongs to a FAISS index."""
+    return os.path.splitext(index_path)[0] + "_chunks.sqlite"
+
+
+class ChunkStore:
+    """Chunk text, token counts, document/page and source offsets, looked up by FAISS id without loading everything."""
+
+    def __init__(self, path, read_only=False):
+        self.path = path
+        self._lock = threading.Lock()
+        if read_only:
+            # Readers query the file lazily through SQLite's own memory map (shared page cache)
+            self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+            self._conn.execute(f"PRAGMA mmap_size = {STORE_MMAP_SIZE}")
+            return
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " faiss_id INTEGER PRIMARY KEY AUTOINCREMENT, doc_id TEXT NOT NULL, chunk_id INTEGER,"
+            " text TEXT NOT NULL, tokens INTEGER, start_char INTEGER, end_char INTEGER,"
+            " page_start INTEGER, page_end INTEGER, metadata TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chunks_doc_id ON chunks (doc_id)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS pending_vectors (faiss_id INTEGER PRIMARY KEY, embedding BLOB NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS removed_vectors (faiss_id INTEGER PRIMARY KEY)")
+        self._create_lexical_index()
+        self._conn.commit()
+
+    def _create_lexical_index(self):
+        """BM25 inverted index (FTS5) over the chunk text, kept in sync with `chunks` by triggers."""
+        exists = self._conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'chunks_fts'").fetchone()
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5("
+            " text, content='chunks', content_rowid='faiss_id', tokenize='unicode61 remove_diacritics 2')"
+        )
+        self._conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS chunks_fts_insert AFTER INSERT ON chunks BEGIN"
+            " INSERT INTO chunks_fts (rowid, text) VALUES (new.faiss_id, new.text); END"
+        )
+        self._conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS chunks_fts_delete AFTER DELETE ON chunks BEGIN"
+            " INSERT INTO chunks_fts (chunks_fts, rowid, text) VALUES ('delete', old.faiss_id, old.text); END"
+        )
+        if not exists:  # Store created before the lexical index existed: index what's already there
+            self._conn.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('rebuild')")
+
+    @staticmethod
+    def _to_row(doc_id, chunk):
+        # Any extra fields (except the embedding) are kept as a small JSON blob
+        chunk = dict(chunk, doc_id=doc_id)
+        extra = {k: v for k, v in chunk.items() if k not in CHUNK_COLUMNS and k not in ("embedding", "faiss_id")}
+        return (*(chunk.get(column) for column in CHUNK_COLUMNS), json.dumps(extra) if extra else None)
+
+    @staticmethod
+    def _from_row(row):
+        faiss_id, *values, extra = row
+        chunk = dict(zip(CHUNK_COLUMNS, values))
+        if extra:
+            chunk.update(json.loads(extra))
+        chunk["faiss_id"] = faiss_id
+        return chunk
+
+    def add_chunks(self, doc_id, chunks, embeddings=None):
+        """Appends a document's chunks and returns their new FAISS ids (never reused after removal).
+        Their `embeddings` (float32 rows), if given, are kept as pending vectors in the same transaction."""
+        with self._lock:
+            faiss_ids = []
+            for chunk in chunks:
+                cursor = self._conn.execute(
+                    f"INSERT INTO chunks ({', '.join(CHUNK_COLUMNS)}, metadata) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    self._to_row(doc_id, chunk),
+                )
+                faiss_ids.append(cursor.lastrowid)
+            if embeddings is not None:
+                self._conn.executemany(
+                    "INSERT INTO pending_vectors (faiss_id, embedding) VALUES (?, ?)",
+                    [(faiss_id, np.asarray(embedding, dtype=np.float32).tobytes()) for faiss_id, embedding in zip(faiss_ids, embeddings)],
+                )
+            self._bump_version()
+            self._conn.commit()
+        return faiss_ids
+
+    def remove_document(self, doc_id):
+        """Deletes a document's chunks and returns the FAISS ids they had. Their pending vectors go too;
+        ids already in the index file are recorded in removed_vectors until it's compacted."""
+        with self._lock:
+            faiss_ids = [row[0] for row in self._conn.execute("SELECT faiss_id FROM chunks WHERE doc_id = ?", (doc_id,))]
+            if faiss_ids:
+                document_ids = "SELECT faiss_id FROM chunks WHERE doc_id = ?"
+                self._conn.execute(
+                    f"INSERT OR IGNORE INTO removed_vectors (faiss_id) {document_ids}"
+                    " AND faiss_id NOT IN (SELECT faiss_id FROM pending_vectors)", (doc_id,)
+                )
+                self._conn.execute(f"DELETE FROM pending_vectors WHERE faiss_id IN ({document_ids})", (doc_id,))
+                self._conn.execute("DELETE FROM chunks WHERE doc_id = ?", (doc_id,))
+                self._bump_version()
+                self._conn.commit()
+        return faiss_ids
+
+    def ids_for_documents(self, doc_ids):
+        """FAISS ids of every chunk that belongs to one of `doc_ids`."""
+        doc_ids = list(doc_ids)
+        if not doc_ids:
+            return []
+        placeholders = ",".join("?" * len(doc_ids))
+        with self._lock:
+            return [
+                row[0] for row in
+                self._conn.execute(f"SELECT faiss_id FROM chunks WHERE doc_id IN ({placeholders})", doc_ids)
+            ]
+
+    def lexical_search(self, query, k=5, doc_ids=None):
+        """
+        BM25 search over chunk text: chunks containing any of the query's words, best first.
+        :return: List of (faiss_id, bm25 score), higher is better ([] if the store has no lexical index)
+        """
+        terms = LEXICAL_TOKEN_REGEX.findall(query)
+        if not terms:
+            return []
+        match = " OR ".join(f'"{term}"' for term in dict.fromkeys(term.lower() for term in terms))
+        sql = "SELECT chunks_fts.rowid, bm25(chunks_fts) AS score FROM chunks_fts"
+        params = [match]
+        if doc_ids is not None:
+            doc_ids = list(doc_ids)
+            if not doc_ids:
+                return []
+            sql += f" JOIN chunks ON chunks.faiss_id = chunks_fts.rowid WHERE chunks_fts MATCH ? AND chunks.doc_id IN ({','.join('?' * len(doc_ids))})"
+            params += doc_ids
+        else:
+            sql += " WHERE chunks_fts MATCH ?"
+        sql += " ORDER BY score LIMIT ?"
+        params.append(k)
+        with self._lock:
+            try:
+                rows = self._conn.execute(sql, params).fetchall()
+            except sqlite3.OperationalError:  # Read-only store written before the lexical index existed
+                return []
+        return [(faiss_id, -score) for faiss_id, score in rows]  # FTS5 bm25() is lower-is-better
+
+    def faiss_ids(self):
+        """Every live FAISS id in the store."""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT faiss_id FROM chunks")]
+
+    def documents(self):
+        """{doc_id: number of chunks} for every document in the store."""
+        with self._lock:
+            return dict(self._conn.execute("SELECT doc_id, COUNT(*) FROM chunks GROUP BY doc_id ORDER BY doc_id"))
+
+    def pending_vectors(self):
+        """(ids, vectors) added since the index file was last written, as int64 / float32 arrays."""
+        with self._lock:
+            try:
+                rows = self._conn.execute("SELECT faiss_id, embedding FROM pending_vectors ORDER BY faiss_id").fetchall()
+            except sqlite3.OperationalError:  # Read-only store written before pending vectors existed
+                rows = []
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32)
+        ids = np.array([faiss_id for faiss_id, _ in rows], dtype=np.int64)
+        return ids, np.vstack([np.frombuffer(embedding, dtype=np.float32) for _, embedding in rows])
+
+    def removed_ids(self):
+        """Ids removed from the store that the index file still holds."""
+        with self._lock:
+            try:
+                return [row[0] for row in self._conn.execute("SELECT faiss_id FROM removed_vectors")]
+            except sqlite3.OperationalError:
+                return []
+
+    def pending_count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM pending_vectors").fetchone()[0]
+
+    def clear_delta(self, pending_ids, removed_ids):
+        """Forgets pending vectors & removed ids once the index file written holds that state."""
+        with self._lock:
+            self._conn.executemany("DELETE FROM pending_vectors WHERE faiss_id = ?", [(int(i),) for i in pending_ids])
+            self._conn.executemany("DELETE FROM removed_vectors WHERE faiss_id = ?", [(int(i),) for i in removed_ids])
+            self._bump_version()
+            self._conn.commit()
+
+    def _bump_version(self):
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        self._conn.execute(f"PRAGMA user_version = {version + 1}")
+
+    def version(self):
+        """Write counter, bumped on every change (used to detect stale readers)."""
+        with self._lock:
+            return self._conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def get_many(self, faiss_ids):
+        """Returns the chunks for `faiss_ids`, in the same order (missing ids are skipped)."""
+        faiss_ids = [int(i) for i in faiss_ids]
+        if not faiss_ids:
+            return []
+        placeholders = ",".join("?" * len(faiss_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT faiss_id, {', '.join(CHUNK_COLUMNS)}, metadata FROM chunks WHERE faiss_id IN ({placeholders})",
+                faiss_ids,
+            ).fetchall()
+        by_id = {row[0]: self._from_row(row) for row in rows}
+        return [by_id[i] for i in faiss_ids if i in by_id]
+
+    def get(self, faiss_id):
+        chunks = self.get_many([faiss_id])
+        return chunks[0] if chunks else None
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
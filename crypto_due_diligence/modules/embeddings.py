@@ -0,0 +1,71 @@
+import os
+import threading
+from modules.ollama_client import OllamaClient  # ✅ Single pooled Ollama client shared by chunking, indexing & search
+from modules.embedding_cache import get_embedding_cache, normalize_text
+from modules import telemetry  # Embedding request spans & counters (no-op unless enabled)
+
+EMBEDDING_MODEL = "nomic-embed-text"
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", "32"))
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """Returns the shared Ollama client (host taken from OLLAMA_HOST, e.g. a local fake server)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OllamaClient(host=os.environ.get("OLLAMA_HOST"))
+    return _client
+
+def reset_client():
+    """Closes the shared client so the next call picks up a new OLLAMA_HOST."""
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        client.close()
+
+def _request_embeddings(texts, model, batch_size):
+    """Sends `texts` to Ollama in batches of `batch_size`, several batches in flight at once."""
+    telemetry.count("embedding_requests", -(-len(texts) // batch_size))
+    telemetry.count("embedded_texts", len(texts))
+    with telemetry.span("embed"):  # Time the caller waits for embeddings
+        return get_client().embed_batches(texts, model=model, batch_size=batch_size)
+
+def embed_texts(texts, model=EMBEDDING_MODEL, batch_size=None, use_cache=True):
+    """
+    Embeds a list of texts, serving repeats from the on-disk cache and batching the rest.
+    :param texts: Texts to embed
+    :param model: Ollama embedding model
+    :param batch_size: Texts per request (defaults to EMBEDDING_BATCH_SIZE)
+    :param use_cache: Look up / store embeddings in the persistent embedding cache
+    :return: List of embeddings, in the same order as `texts`
+    """
+    texts = list(texts)
+    batch_size = batch_size or EMBEDDING_BATCH_SIZE
+    cache = get_embedding_cache() if use_cache else None
+    embeddings = cache.get_many(model, texts) if cache else [None] * len(texts)
+
+    # Embed each distinct missing text once, even if it repeats within this call
+    pending = {}
+    for i, embedding in enumerate(embeddings):
+        if embedding is None:
+            pending.setdefault(normalize_text(texts[i]), []).append(i)
+
+    telemetry.count("embedding_cache_hits", len(texts) - sum(len(positions) for positions in pending.values()))
+    if pending:
+        missing_texts = [texts[positions[0]] for positions in pending.values()]
+        new_embeddings = _request_embeddings(missing_texts, model, batch_size)
+        for positions, embedding in zip(pending.values(), new_embeddings):
+            for i in positions:
+                embeddings[i] = embedding
+        if cache:
+            cache.put_many(model, missing_texts, new_embeddings)
+
+    return embeddings
+
+def embed_text(text, model=EMBEDDING_MODEL):
+    """Embeds a single text (e.g. a search query)."""
+    return embed_texts([text], model=model)[0]
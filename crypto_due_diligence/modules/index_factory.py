@@ -0,0 +1,108 @@
+import math
+import os
+import faiss
+import numpy as np
+
+# Index types the corpus can be (re)built as; every one is addressed by chunk-store ids.
+#   flat      exact search, 4 bytes/dim, supports add & remove
+#   ivf_flat  inverted lists over full vectors, needs training
+#   hnsw      graph search, no training, vectors can't be removed (removed chunks become tombstones)
+#   ivf_pq    inverted lists + product quantization (pq_m bytes/vector), needs training
+#   ivf_sq8   inverted lists + int8 scalar quantization (1 byte/dim), needs training
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq", "ivf_sq8")
+
+SEARCH_NPROBE = int(os.environ.get("FAISS_NPROBE", "16"))  # IVF lists visited per query
+HNSW_EF_SEARCH = int(os.environ.get("FAISS_EF_SEARCH", "64"))  # HNSW candidate list size per query
+TRAIN_SAMPLE_SIZE = 50000  # Vectors sampled for IVF / PQ training
+
+def default_nlist(n_vectors):
+    """Rule of thumb: ~4*sqrt(N) inverted lists, at least 39 training points per list."""
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39))
+
+def factory_string(index_type, n_vectors, nlist=None, pq_m=64, hnsw_m=32):
+    """FAISS index_factory description for one of INDEX_TYPES."""
+    nlist = nlist or default_nlist(n_vectors)
+    descriptions = {
+        "flat": "IDMap2,Flat",
+        "ivf_flat": f"IVF{nlist},Flat",
+        "hnsw": f"IDMap2,HNSW{hnsw_m}",
+        "ivf_pq": f"IVF{nlist},PQ{pq_m}",
+        "ivf_sq8": f"IVF{nlist},SQ8",
+    }
+    if index_type not in descriptions:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+    return descriptions[index_type]
+
+def create_index(index_type, dim, n_vectors, nlist=None, pq_m=64, hnsw_m=32):
+    """Empty (untrained) index of the requested type."""
+    return faiss.index_factory(dim, factory_string(index_type, n_vectors, nlist, pq_m, hnsw_m))
+
+def train_index(index, vectors, sample_size=TRAIN_SAMPLE_SIZE, seed=1234):
+    """Trains IVF/PQ/SQ indexes on a random sample of `vectors` (no-op for flat & HNSW)."""
+    if index.is_trained:
+        return index
+    if len(vectors) > sample_size:
+        rows = np.random.default_rng(seed).choice(len(vectors), sample_size, replace=False)
+        vectors = vectors[np.sort(rows)]
+    index.train(np.ascontiguousarray(vectors, dtype=np.float32))
+    return index
+
+def build_index(index_type, vectors, ids, nlist=None, pq_m=64, hnsw_m=32, sample_size=TRAIN_SAMPLE_SIZE):
+    """Creates, trains and fills an index of `index_type` with `vectors` addressed by `ids`."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = create_index(index_type, vectors.shape[1], len(vectors), nlist, pq_m, hnsw_m)
+    train_index(index, vectors, sample_size)
+    index.add_with_ids(vectors, np.asarray(ids, dtype=np.int64))
+    return index
+
+def inner_index(index):
+    """The index doing the actual search (unwraps IndexIDMap/IndexIDMap2)."""
+    if isinstance(index, faiss.IndexIDMap):
+        return faiss.downcast_index(index.index)
+    return index
+
+def supports_removal(index):
+    """HNSW graphs can't drop vectors; everything else here can."""
+    return not isinstance(inner_index(index), faiss.IndexHNSW)
+
+def search_params(index, selector=None, nprobe=SEARCH_NPROBE, ef_search=HNSW_EF_SEARCH):
+    """SearchParameters of the right type for `index`, optionally restricted to `selector` ids."""
+    inner = inner_index(index)
+    if isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=ef_search)
+    return faiss.SearchParameters(sel=selector) if selector is not None else None
+
+def export_vectors(index):
+    """Returns (vectors, ids) stored in an index (approximate for quantized indexes)."""
+    inner = inner_index(index)
+    if isinstance(index, faiss.IndexIDMap):
+        ids = faiss.vector_to_array(index.id_map).astype(np.int64)
+        return inner.reconstruct_n(0, index.ntotal), ids
+
+    ivf = faiss.extract_index_ivf(index)
+    ivf.set_direct_map_type(faiss.DirectMap.Hashtable)  # Ids are chunk-store ids, not 0..N-1
+    invlists = ivf.invlists
+    ids = []
+    for list_no in range(ivf.nlist):
+        list_size = invlists.list_size(list_no)
+        if list_size:
+            ids.append(faiss.rev_swig_ptr(invlists.get_ids(list_no), list_size).copy())
+    ids = np.concatenate(ids).astype(np.int64) if ids else np.empty(0, dtype=np.int64)
+    vectors = np.vstack([ivf.reconstruct(int(i)) for i in ids]) if len(ids) else np.empty((0, ivf.d), dtype=np.float32)
+    return vectors, ids
+
+def mmap_flags(index_path):
+    """read_index flags that memory-map an index file read-only (0 if this FAISS build can't)."""
+    with open(index_path, "rb") as f:
+        fourcc = f.read(4)
+    if fourcc.startswith(b"Iw"):  # IVF family: inverted lists are mapped straight from the file
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    if hasattr(faiss, "IO_FLAG_MMAP_IFC"):  # Flat / HNSW storage: vector codes are mapped
+        return faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+    return 0
+
+def index_bytes(index):
+    """Serialized size of an index (what it costs on disk / in RAM)."""
+    return faiss.serialize_index(index).nbytes
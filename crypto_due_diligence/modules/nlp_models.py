@@ -0,0 +1,62 @@
+import threading
+
+# Process-wide registry of the heavy NLP models. Nothing is loaded at import time:
+# each model is loaded on first use, once per process, and shared by every module.
+SPACY_MODEL = "en_core_web_lg"
+SPACY_COMPONENTS = ("tok2vec", "tagger", "parser", "senter", "attribute_ruler", "lemmatizer", "ner")
+NER_PIPES = ("tok2vec", "ner")  # What entity extraction runs
+CHUNK_PIPES = ("tok2vec", "senter", "ner")  # Sentence & entity spans decide where chunks may end
+# One pipeline with every component either needs (one copy of the model in memory); the rest is never loaded
+SPACY_PIPES = tuple(dict.fromkeys(NER_PIPES + CHUNK_PIPES))
+TOKEN_ENCODING = "cl100k_base"
+
+_models = {}
+_lock = threading.Lock()
+
+def _get_or_load(key, loader):
+    model = _models.get(key)
+    if model is None:
+        with _lock:
+            model = _models.get(key)
+            if model is None:
+                model = _models[key] = loader()
+    return model
+
+def get_spacy_model(name=SPACY_MODEL, pipes=SPACY_PIPES):
+    """Returns the shared spaCy pipeline with only `pipes` loaded (components not listed are excluded)."""
+    def load():
+        import spacy  # Deferred: importing spaCy alone costs noticeable startup time
+
+        nlp = spacy.load(name, exclude=[component for component in SPACY_COMPONENTS if component not in pipes])
+        for component in pipes:
+            if component in nlp.disabled:  # e.g. "senter" ships disabled
+                nlp.enable_pipe(component)
+        return nlp
+
+    return _get_or_load(("spacy", name, tuple(pipes)), load)
+
+def pipes_except(nlp, pipes):
+    """Components of `nlp` to skip so a call runs only `pipes`: pass as `nlp(text, disable=...)` or
+    `nlp.pipe(texts, disable=...)`, which (unlike select_pipes) leaves the shared pipeline untouched
+    for other threads."""
+    return [name for name in nlp.pipe_names if name not in pipes]
+
+def get_sentiment_analyzer():
+    """Returns the shared VADER sentiment analyzer."""
+    def load():
+        from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+        return SentimentIntensityAnalyzer()
+
+    return _get_or_load(("vader",), load)
+
+def get_tokenizer(encoding=TOKEN_ENCODING):
+    """Returns the shared tiktoken encoder used for token counts."""
+    def load():
+        import tiktoken
+        return tiktoken.get_encoding(encoding)
+
+    return _get_or_load(("tiktoken", encoding), load)
+
+def loaded_models():
+    """Keys of the models loaded so far in this process (for diagnostics)."""
+    return list(_models)
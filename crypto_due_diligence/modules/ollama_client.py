@@ -0,0 +1,255 @@
+import asyncio
+import os
+import queue
+import random
+import threading
+import time
+from collections import deque
+import httpx
+import ollama
+from modules import telemetry
+
+# One client layer for every Ollama call (embeddings & chat):
+#   - async API on ollama.AsyncClient, with a pooled (keep-alive) HTTP connection set to the host
+#   - at most OLLAMA_MAX_IN_FLIGHT requests in flight, shared by every caller in the process
+#   - transient failures (connection errors, timeouts, 429/5xx) retried with exponential backoff
+#   - per-operation latency metrics (see OllamaClient.stats)
+# The client owns an event loop running in a background thread; the sync wrappers (embed, chat, ...)
+# submit coroutines to it, so sync code, worker threads and async code all share one connection pool.
+OLLAMA_MAX_IN_FLIGHT = int(os.environ.get("OLLAMA_MAX_IN_FLIGHT", "4"))
+OLLAMA_TIMEOUT = float(os.environ.get("OLLAMA_TIMEOUT", "120"))  # Seconds per request (connect: 10 s)
+OLLAMA_MAX_RETRIES = int(os.environ.get("OLLAMA_MAX_RETRIES", "3"))
+OLLAMA_RETRY_BACKOFF = 0.5  # Seconds before the first retry, doubled on each further retry (+ jitter)
+RETRY_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+LATENCY_WINDOW = 1000  # Latest latencies kept per operation for percentiles
+
+def is_retryable(error):
+    """Connection problems, timeouts and overloaded-server responses are worth retrying."""
+    if isinstance(error, ollama.ResponseError):
+        return error.status_code in RETRY_STATUS_CODES
+    return isinstance(error, (ConnectionError, httpx.TransportError))
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class OllamaClient:
+    """Pooled, concurrency-limited, retrying Ollama client with async and sync entry points."""
+
+    def __init__(self, host=None, max_in_flight=OLLAMA_MAX_IN_FLIGHT, timeout=OLLAMA_TIMEOUT,
+                 max_retries=OLLAMA_MAX_RETRIES, backoff=OLLAMA_RETRY_BACKOFF):
+        self.host = host or os.environ.get("OLLAMA_HOST")
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._loop = None
+        self._pid = None
+        self._thread = None
+        self._client = None
+        self._semaphore = None
+        self._start_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {}
+
+    # Event loop & connection pool
+
+    def _ensure_started(self):
+        if self._loop is not None and self._pid != os.getpid():
+            self._loop = None  # Forked child: the parent's loop thread doesn't exist here
+        if self._loop is None:
+            with self._start_lock:
+                if self._loop is None:
+                    self._pid = os.getpid()
+                    loop = asyncio.new_event_loop()
+                    self._thread = threading.Thread(target=loop.run_forever, name="ollama-client", daemon=True)
+                    self._thread.start()
+                    asyncio.run_coroutine_threadsafe(self._open(), loop).result()
+                    self._loop = loop
+        return self._loop
+
+    async def _open(self):
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        self._client = ollama.AsyncClient(
+            host=self.host,
+            timeout=httpx.Timeout(self.timeout, connect=10.0),
+            limits=httpx.Limits(max_connections=self.max_in_flight, max_keepalive_connections=self.max_in_flight),
+        )
+
+    async def _on_loop(self, coro):
+        """Awaits `coro` on the client's loop, whichever loop the caller runs on."""
+        loop = self._ensure_started()
+        try:
+            if asyncio.get_running_loop() is loop:
+                return await coro
+        except RuntimeError:
+            pass
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    def run(self, coro):
+        """Runs a coroutine on the client's loop and blocks for its result (the sync entry point)."""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_started()).result()
+
+    # Requests with concurrency limit, retries & metrics
+
+    def _record(self, operation, seconds=None, error=False, retry=False):
+        with self._metrics_lock:
+            metrics = self._metrics.setdefault(operation, {
+                "requests": 0, "errors": 0, "retries": 0, "latencies": deque(maxlen=LATENCY_WINDOW),
+            })
+            if seconds is not None:
+                metrics["requests"] += 1
+                metrics["latencies"].append(seconds)
+            metrics["errors"] += error
+            metrics["retries"] += retry
+        if seconds is not None:
+            telemetry.observe("ollama", seconds, operation=operation)
+        if error or retry:
+            telemetry.count("ollama_errors" if error else "ollama_retries", operation=operation)
+
+    async def _request(self, operation, send):
+        """Sends one request (`send()` returns a fresh coroutine per attempt), retrying transient failures."""
+        for attempt in range(self.max_retries + 1):
+            async with self._semaphore:  # Released while backing off, so other requests proceed
+                start = time.perf_counter()
+                try:
+                    response = await send()
+                except Exception as e:
+                    if not is_retryable(e) or attempt == self.max_retries:
+                        self._record(operation, error=True)
+                        raise
+                else:
+                    self._record(operation, time.perf_counter() - start)
+                    return response
+            self._record(operation, retry=True)
+            await asyncio.sleep(self.backoff * (2 ** attempt) * (1 + random.random() / 2))
+
+    # Async API
+
+    async def embed_async(self, model, input):
+        """One /api/embed request."""
+        return await self._on_loop(self._request("embed", lambda: self._client.embed(model=model, input=input)))
+
+    async def embed_batches_async(self, texts, model, batch_size):
+        """Embeds `texts` in batches of `batch_size`, sending up to `max_in_flight` batches at once."""
+        async def embed_batch(batch):
+            response = await self._request("embed", lambda: self._client.embed(model=model, input=batch))
+            embeddings = response["embeddings"]
+            if len(embeddings) != len(batch):
+                raise ValueError(f"Expected {len(batch)} embeddings from {model}, got {len(embeddings)}")
+            return embeddings
+
+        async def embed_all():
+            batches = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+            results = await asyncio.gather(*(embed_batch(batch) for batch in batches))
+            return [embedding for batch in results for embedding in batch]
+
+        return await self._on_loop(embed_all())
+
+    async def chat_async(self, model, messages, **kwargs):
+        """One non-streaming /api/chat request."""
+        return await self._on_loop(
+            self._request("chat", lambda: self._client.chat(model=model, messages=messages, **kwargs))
+        )
+
+    async def _stream_chat(self, model, messages, sink, **kwargs):
+        """Streams /api/chat, calling `sink(text)` per piece and `sink(None)` at the end.
+
+        Failures are retried only until the first piece arrives; the in-flight slot is held
+        for the whole generation.
+        """
+        start = time.perf_counter()
+        first_piece = None
+        try:
+            for attempt in range(self.max_retries + 1):
+                async with self._semaphore:
+                    try:
+                        stream = await self._client.chat(model=model, messages=messages, stream=True, **kwargs)
+                        async for part in stream:
+                            if first_piece is None:
+                                first_piece = time.perf_counter()
+                            sink(part["message"]["content"])
+                    except Exception as e:
+                        if first_piece is not None or not is_retryable(e) or attempt == self.max_retries:
+                            self._record("chat_stream", error=True)
+                            raise
+                    else:
+                        self._record("chat_stream", time.perf_counter() - start)
+                        if first_piece is not None:
+                            self._record("chat_ttft", first_piece - start)
+                        return
+                self._record("chat_stream", retry=True)
+                await asyncio.sleep(self.backoff * (2 ** attempt) * (1 + random.random() / 2))
+        finally:
+            sink(None)
+
+    async def chat_stream_async(self, model, messages, **kwargs):
+        """Async generator of answer pieces from a streaming /api/chat request (any event loop)."""
+        loop = asyncio.get_running_loop()
+        pieces = asyncio.Queue()
+        future = asyncio.run_coroutine_threadsafe(
+            self._stream_chat(model, messages, lambda piece: loop.call_soon_threadsafe(pieces.put_nowait, piece), **kwargs),
+            self._ensure_started(),
+        )
+        try:
+            while (piece := await pieces.get()) is not None:
+                yield piece
+            await asyncio.wrap_future(future)  # Re-raise a failed stream
+        finally:
+            future.cancel()
+
+    # Sync wrappers (drop-in for ollama.Client.embed / chat)
+
+    def embed(self, model, input):
+        return self.run(self.embed_async(model, input))
+
+    def embed_batches(self, texts, model, batch_size):
+        return self.run(self.embed_batches_async(texts, model, batch_size))
+
+    def chat(self, model, messages, **kwargs):
+        return self.run(self.chat_async(model, messages, **kwargs))
+
+    def chat_stream(self, model, messages, **kwargs):
+        """Generator of answer pieces as the model produces them (closing it early stops the request)."""
+        pieces = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(
+            self._stream_chat(model, messages, pieces.put, **kwargs), self._ensure_started()
+        )
+        try:
+            while (piece := pieces.get()) is not None:
+                yield piece
+            future.result()  # Re-raise a failed stream
+        finally:
+            future.cancel()
+
+    # Metrics & lifecycle
+
+    def stats(self):
+        """{operation: requests, errors, retries, latency p50/p95/max in ms} since the client was created."""
+        with self._metrics_lock:
+            stats = {}
+            for operation, metrics in self._metrics.items():
+                latencies = list(metrics["latencies"])
+                stats[operation] = {
+                    "requests": metrics["requests"],
+                    "errors": metrics["errors"],
+                    "retries": metrics["retries"],
+                }
+                if latencies:
+                    stats[operation].update(
+                        latency_ms_p50=round(_percentile(latencies, 0.50) * 1000, 2),
+                        latency_ms_p95=round(_percentile(latencies, 0.95) * 1000, 2),
+                        latency_ms_max=round(max(latencies) * 1000, 2),
+                    )
+            return stats
+
+    def close(self):
+        """Closes the connection pool and stops the client's loop."""
+        if self._loop is None:
+            return
+        loop, self._loop = self._loop, None
+        asyncio.run_coroutine_threadsafe(self._client.close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join()
+        loop.close()
@@ -1,14 +1,18 @@
-import spacy
+import os
+from collections import Counter, defaultdict
 import pyap  # Extracts addresses
 import phonenumbers  # Extracts phone numbers
 from thefuzz import fuzz  # Fuzzy matching for company names
 import regex  # Advanced regex handling for legal text
 from email_validator import validate_email, EmailNotValidError  # Validates and extracts emails
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer  # Sentiment Analysis
+from modules.nlp_models import get_sentiment_analyzer, get_spacy_model, pipes_except, NER_PIPES  # Lazily loaded, shared models
+from modules.term_matcher import TermMatcher, load_lexicon_dir  # One-pass, word-boundary term matching
+from modules import telemetry  # NER & per-page analysis spans (no-op unless enabled)
 
-# Load NLP Model
-nlp = spacy.load("en_core_web_lg")
-sentiment_analyzer = SentimentIntensityAnalyzer()  # Load Sentiment Model
+# NER runs once over the document, in segments, with only the components it needs
+NER_BATCH_SIZE = 32  # Segments per nlp.pipe batch
+NER_N_PROCESS = 1  # > 1 parses segments in parallel worker processes
+NER_SEGMENT_CHARS = 20000  # Well below nlp.max_length, so long documents never overflow it
 
 # Define financial, regulatory, and risk terms
 FINANCIAL_TERMS = {
@@ -21,6 +25,15 @@ CRYPTO_TERMS = {
     "Bitcoin", "Ethereum", "Solana", "Chainlink", "Binance", "Tether", "DeFi", "NFT", "DAO", "staking", "hashrate"
 }
 RISK_TERMS = {"fraud", "scam", "money laundering", "ponzi", "hacked", "insider trading", "lawsuit"}
+TERM_LEXICONS = {
+    "financial_terms": FINANCIAL_TERMS,
+    "regulations": REGULATIONS,
+    "crypto_terms": CRYPTO_TERMS,
+    "risk_mentions": RISK_TERMS,
+}
+# Extra lexicons, one `<category>.txt` per category (e.g. sanctions.txt, tickers.txt, or more risk_mentions)
+LEXICON_DIR = os.environ.get("LEXICON_DIR", os.path.join("config", "lexicons"))
+ACRONYM_LEXICONS = {"regulations", "crypto_terms", "tickers"}  # ALL-CAPS terms need ALL-CAPS text: "SEC" but not "Sec."
 
 def extract_emails(text):
     """Extracts valid email addresses using email-validator."""
@@ -57,37 +70,73 @@ def extract_cik_numbers(text):
     """Extracts SEC CIK Numbers (unique identifier for publicly traded companies)."""
     return regex.findall(r"CIK\s*(\d{10})", text)
 
+def split_segments(text, max_chars=NER_SEGMENT_CHARS):
+    """Cuts text into segments of at most `max_chars`, preferring paragraph, sentence, then word breaks."""
+    start = 0
+    while start < len(text):
+        end = min(start + max_chars, len(text))
+        if end < len(text):
+            window = text[start:end]
+            for separator in ("\n\n", ". ", " "):
+                cut = window.rfind(separator)
+                if cut > max_chars // 2:
+                    end = start + cut + len(separator)
+                    break
+        if text[start:end].strip():
+            yield text[start:end]
+        start = end
+
+def extract_named_entities(texts, batch_size=NER_BATCH_SIZE, n_process=NER_N_PROCESS):
+    """Runs spaCy NER in a single pass over segments of `texts`; returns {label: set of entity texts}."""
+    nlp = get_spacy_model()  # Shared with chunking; tagger, parser & lemmatizer are never loaded
+    segments = (segment for text in texts for segment in split_segments(text))
+    entities = defaultdict(set)
+    with telemetry.span("spacy", task="ner"):
+        for doc in nlp.pipe(segments, batch_size=batch_size, n_process=n_process, disable=pipes_except(nlp, NER_PIPES)):
+            for ent in doc.ents:
+                entities[ent.label_].add(ent.text)
+    return entities
+
 def extract_company_names(text):
     """Extracts company names using spaCy NLP model."""
-    doc = nlp(text)
-    return list(set(ent.text for ent in doc.ents if ent.label_ == "ORG"))
+    return list(extract_named_entities([text])["ORG"])
 
 def extract_person_names(text):
     """Extracts names of people from the document (CEOs, executives, legal figures)."""
-    doc = nlp(text)
-    return list(set(ent.text for ent in doc.ents if ent.label_ == "PERSON"))
+    return list(extract_named_entities([text])["PERSON"])
 
-def extract_financial_terms(text):
-    """Identifies financial keywords, regulations, and risk-related mentions."""
-    found_terms = [term for term in FINANCIAL_TERMS if term.lower() in text.lower()]
-    found_regs = [reg for reg in REGULATIONS if reg in text]
-    found_crypto = [crypto for crypto in CRYPTO_TERMS if crypto in text]
-    found_risks = [risk for risk in RISK_TERMS if risk in text]
+_term_matcher = None
 
-    return {
-        "financial_terms": found_terms,
-        "regulations": found_regs,
-        "crypto_terms": found_crypto,
-        "risk_mentions": found_risks,
+def get_term_matcher():
+    """Builds the term matcher once: built-in lexicons plus any lexicon files in LEXICON_DIR."""
+    global _term_matcher
+    if _term_matcher is None:
+        matcher = TermMatcher(TERM_LEXICONS, acronym=ACRONYM_LEXICONS)
+        for category, terms in load_lexicon_dir(LEXICON_DIR).items():
+            matcher.add_terms(category, terms)
+        _term_matcher = matcher
+    return _term_matcher
+
+def extract_financial_terms(text):
+    """Identifies financial keywords, regulations, and risk-related mentions (whole words, one pass)."""
+    matches = get_term_matcher().count(text)
+    found = {category: sorted(terms) for category, terms in matches.items()}
+    found["term_counts"] = {
+        category: {term: entry["count"] for term, entry in terms.items()}
+        for category, terms in matches.items()
     }
+    return found
 
-def calculate_risk_score(found_risks):
+def calculate_risk_score(found_risks, risk_counts=None):
     """Assigns a risk score based on risk-related keywords found (scale of 0-10)."""
-    return min(10, len(found_risks) * 2)  # Each mention increases score by 2 (max 10)
+    score = len(found_risks) * 2  # Each distinct risk term increases score by 2
+    if risk_counts:
+        score += sum(count - 1 for count in risk_counts.values()) // 2  # +1 per two repeated mentions
+    return min(10, score)
 
 def analyze_sentiment(text):
     """Analyzes sentiment of extracted text to assess risk perception."""
-    sentiment_scores = sentiment_analyzer.polarity_scores(text)
+    sentiment_scores = get_sentiment_analyzer().polarity_scores(text)
     sentiment_label = "neutral"
     if sentiment_scores["compound"] >= 0.05:
         sentiment_label = "positive"
@@ -99,28 +148,69 @@ def analyze_sentiment(text):
         "sentiment_score": sentiment_scores["compound"]  # Value between -1 (neg) to +1 (pos)
     }
 
-def extract_entities(text):
-    """Extracts structured data from text for crypto due diligence analysis."""
+def extract_pattern_entities(text, term_text=None):
+    """Everything except spaCy NER: contact details, identifiers and term mentions.
+    Terms are matched on `term_text` when given (the raw page, whose capitalization acronyms need)."""
     extracted_data = {
-        "company_names": extract_company_names(text),
-        "person_names": extract_person_names(text),
         "emails": extract_emails(text),
         "phone_numbers": extract_phone_numbers(text),
         "websites": extract_websites(text),
         "addresses": extract_addresses(text),
         "cik_numbers": extract_cik_numbers(text),
     }
+    extracted_data.update(extract_financial_terms(text if term_text is None else term_text))
+    return extracted_data
+
+def extract_entities(text, batch_size=NER_BATCH_SIZE, n_process=NER_N_PROCESS, clean=None):
+    """Extracts structured data from text for crypto due diligence analysis."""
+    return extract_entities_from_pages([(None, text)], batch_size=batch_size, n_process=n_process, clean=clean)
+
+def extract_entities_from_pages(pages, batch_size=NER_BATCH_SIZE, n_process=NER_N_PROCESS, clean=None):
+    """Streaming version of `extract_entities`: pattern extractors & sentiment run page by page,
+    while the pages are fed to a single batched NER pass (sentiment is the length-weighted
+    average over pages). With `clean` (e.g. `clean_text`), pages are raw: terms are matched on
+    the raw text and everything else runs on `clean(text)`."""
+    merged = defaultdict(set)
+    term_counts = defaultdict(Counter)
+    sentiment = {"total": 0.0, "weight": 0}
+
+    def analyzed_pages():
+        # Pulled by the NER pass, so it runs inside the spacy span: its own span (closed before each
+        # yield) keeps patterns, term matching & VADER out of NER's self time
+        for _, raw in pages:
+            text = clean(raw) if clean else raw
+            if not text.strip():
+                continue
+            with telemetry.span("page_analysis"):
+                page_results = extract_pattern_entities(text, term_text=raw)
+                for category, counts in page_results.pop("term_counts").items():
+                    term_counts[category].update(counts)
+                for key, values in page_results.items():
+                    merged[key].update(values)
+                sentiment["total"] += analyze_sentiment(text)["sentiment_score"] * len(text)
+                sentiment["weight"] += len(text)
+            yield text
+
+    named_entities = extract_named_entities(analyzed_pages(), batch_size=batch_size, n_process=n_process)
 
-    financial_analysis = extract_financial_terms(text)
-    extracted_data.update(financial_analysis)
+    extracted_data = {
+        "company_names": sorted(named_entities["ORG"]),
+        "person_names": sorted(named_entities["PERSON"]),
+    }
+    for key in ("emails", "phone_numbers", "websites", "addresses", "cik_numbers", *get_term_matcher().categories):
+        extracted_data[key] = sorted(merged[key])
+    extracted_data["term_counts"] = {category: dict(term_counts[category]) for category in get_term_matcher().categories}
 
-    # Compute risk score
-    extracted_data["risk_score"] = calculate_risk_score(financial_analysis["risk_mentions"])
+    # Compute risk score (distinct risk terms, weighted by how often they are mentioned)
+    extracted_data["risk_score"] = calculate_risk_score(extracted_data["risk_mentions"], term_counts["risk_mentions"])
 
     # Add Sentiment Analysis
-    sentiment_data = analyze_sentiment(text)
-    extracted_data.update(sentiment_data)
+    compound = sentiment["total"] / sentiment["weight"] if sentiment["weight"] else 0.0
+    extracted_data["sentiment"] = "positive" if compound >= 0.05 else "negative" if compound <= -0.05 else "neutral"
+    extracted_data["sentiment_score"] = round(compound, 4)
 
+    # Every entity type found by the same NER pass
+    extracted_data["named_entities"] = {label: sorted(texts) for label, texts in sorted(named_entities.items())}
     return extracted_data
 
 # 🔥 TESTING THE MODULE
@@ -1,58 +1,158 @@
 import fitz  # PyMuPDF for digital PDFs
 import pytesseract  # OCR for scanned PDFs
 from pdf2image import convert_from_path  # Convert scanned PDFs to images
+import multiprocessing
 import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from modules import telemetry  # Page counters & OCR wait spans (no-op unless enabled)
 
 # Set Tesseract OCR path (Windows users may need to change this)
 # Uncomment & modify the below line if Tesseract isn't detected automatically
 # pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
 
+SCANNED_PAGE_THRESHOLD = 50  # Pages with fewer characters of digital text are OCR'd
+OCR_DPI = 200  # pdf2image default
+OCR_WORKERS = os.cpu_count() or 1  # Parallel OCR processes (each holds one page image at a time)
+# OCR processes are fresh interpreters: callers run threads (the app's job threads, the Ollama client's
+# event loop, ingest's embedders), and a forked child could inherit one of their locks held
+OCR_START_METHOD = "spawn"
+
+def _ocr_pool(max_workers):
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(OCR_START_METHOD))
+
 def extract_text_from_digital_pdf(pdf_path):
     """
     Extracts text from a digital (non-scanned) PDF using PyMuPDF.
     :param pdf_path: Path to the PDF file
     :return: Extracted text as a string
     """
-    doc = fitz.open(pdf_path)
-    text = ""
+    with fitz.open(pdf_path) as doc:
+        return "\n".join(page.get_text("text") for page in doc).strip()
 
-    for page in doc:
-        text += page.get_text("text") + "\n"
 
-    return text.strip()
+def _ocr_page(pdf_path, page_number, dpi=OCR_DPI):
+    """Rasterizes a single page and runs Tesseract on it (executed in a worker process)."""
+    images = convert_from_path(pdf_path, dpi=dpi, first_page=page_number, last_page=page_number)
+    return page_number, pytesseract.image_to_string(images[0]) if images else ""
 
 
-def extract_text_from_scanned_pdf(pdf_path):
+def ocr_pages(pdf_path, page_numbers, max_workers=None, dpi=OCR_DPI):
     """
-    Extracts text from a scanned PDF using OCR (Tesseract).
+    OCRs the given pages across a process pool, rasterizing one page per task.
+    At most 2 x `max_workers` pages are in flight, so memory stays bounded on long PDFs.
+    :param pdf_path: Path to the PDF file
+    :param page_numbers: 1-based page numbers to OCR
+    :return: {page_number: text}
+    """
+    page_numbers = list(page_numbers)
+    max_workers = min(max_workers or OCR_WORKERS, len(page_numbers))
+    results = {}
+    if not page_numbers:
+        return results
+    if max_workers == 1:
+        for page_number in page_numbers:
+            results[page_number] = _ocr_page(pdf_path, page_number, dpi)[1]
+        return results
+
+    remaining = iter(page_numbers)
+    with _ocr_pool(max_workers) as pool:
+        pending = set()
+        for page_number in remaining:
+            pending.add(pool.submit(_ocr_page, pdf_path, page_number, dpi))
+            if len(pending) >= 2 * max_workers:
+                break
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                page_number, text = future.result()
+                results[page_number] = text
+                next_page = next(remaining, None)
+                if next_page is not None:
+                    pending.add(pool.submit(_ocr_page, pdf_path, next_page, dpi))
+    return results
+
+
+def extract_text_from_scanned_pdf(pdf_path, max_workers=None):
+    """
+    Extracts text from a scanned PDF using OCR (Tesseract), one page at a time in parallel.
     :param pdf_path: Path to the PDF file
     :return: Extracted text as a string
     """
-    images = convert_from_path(pdf_path)
-    extracted_text = ""
+    with fitz.open(pdf_path) as doc:
+        page_count = doc.page_count
+    texts = ocr_pages(pdf_path, range(1, page_count + 1), max_workers=max_workers)
+    return "\n".join(texts[page_number] for page_number in sorted(texts)).strip()
 
-    for image in images:
-        extracted_text += pytesseract.image_to_string(image) + "\n"
 
-    return extracted_text.strip()
+def iter_pages(pdf_path, max_workers=None, dpi=OCR_DPI):
+    """
+    Streams a PDF as (page_number, text) records, in page order.
+    Digital pages are read directly; pages with no usable text are OCR'd in a process pool
+    (or inline with `max_workers=1`, e.g. in an ingest file worker).
+    At most 2 x `max_workers` pages are held (read ahead or being OCR'd) at any time.
+    :param pdf_path: Path to the PDF file
+    :return: Generator of (page_number, text), 1-based
+    """
+    max_workers = max_workers or OCR_WORKERS
+    window = 2 * max_workers
+    pending = deque()  # (page_number, text or OCR future), in page order
+    pool = None
+
+    def resolve(record):
+        page_number, text = record
+        if isinstance(text, Future):
+            with telemetry.span("ocr_wait"):  # Time the reader is held up by OCR
+                text = text.result()[1]
+        return page_number, text.strip()
+
+    try:
+        with fitz.open(pdf_path) as doc:
+            for page in doc:
+                page_number = page.number + 1
+                text = page.get_text("text")
+                scanned = len(text.strip()) < SCANNED_PAGE_THRESHOLD
+                telemetry.count("pages", source="ocr" if scanned else "digital")
+                if scanned and max_workers == 1:
+                    with telemetry.span("ocr_wait"):
+                        text = _ocr_page(pdf_path, page_number, dpi)[1]
+                elif scanned:
+                    if pool is None:
+                        pool = _ocr_pool(max_workers)
+                    text = pool.submit(_ocr_page, pdf_path, page_number, dpi)
+                pending.append((page_number, text))
+
+                # Emit pages that are ready; block on the oldest one once the window is full
+                while pending and (
+                    len(pending) > window
+                    or not isinstance(pending[0][1], Future)
+                    or pending[0][1].done()
+                ):
+                    yield resolve(pending.popleft())
+
+        while pending:
+            yield resolve(pending.popleft())
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+
+def extract_pages(pdf_path, max_workers=None):
+    """
+    Extracts text page by page: digital text where the page has it, OCR only for scanned pages.
+    :param pdf_path: Path to the PDF file
+    :return: List of (page_number, text), 1-based and in page order
+    """
+    return list(iter_pages(pdf_path, max_workers=max_workers))
 
 
-def extract_text_from_pdf(pdf_path):
+def extract_text_from_pdf(pdf_path, max_workers=None):
     """
-    Determines whether a PDF is digital or scanned, then extracts text accordingly.
+    Extracts text from a PDF, OCR'ing only the pages that have no usable digital text.
     :param pdf_path: Path to the PDF file
     :return: Extracted text as a string
     """
-    text = extract_text_from_digital_pdf(pdf_path)
-
-    # If the extracted text is mostly empty, assume it's a scanned PDF
-    if len(text.strip()) < 50:  # Threshold to detect scanned PDFs
-        print(f"📄 {pdf_path} seems scanned, using OCR...")
-        text = extract_text_from_scanned_pdf(pdf_path)
-    else:
-        print(f"📄 {pdf_path} is digital, extracting text directly...")
-
-    return text.strip()
+    return "\n".join(text for _, text in iter_pages(pdf_path, max_workers=max_workers)).strip()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,278 @@
+import hashlib
+import json
+import os
+import time
+from modules.pdf_text_extractor import iter_pages, OCR_DPI, SCANNED_PAGE_THRESHOLD  # Streams raw text page by page
+from modules.text_cleaning import clean_pages, clean_text  # Cleans extracted text
+from modules.pdf_feature_extractor import (
+    extract_entities_from_pages, ACRONYM_LEXICONS, LEXICON_DIR, NER_SEGMENT_CHARS, TERM_LEXICONS
+)
+from modules.text_chunker import smart_chunk_pages, save_chunks_to_json, CHUNK_OVERLAP_TOKENS
+from modules.vector_database import ensure_embeddings, save_to_faiss, DEFAULT_INDEX_PATH  # FAISS Vector Database Storage
+from modules.chunk_store import ChunkStore, chunk_store_path_for
+from modules.embeddings import EMBEDDING_MODEL
+from modules.nlp_models import CHUNK_PIPES, NER_PIPES, SPACY_MODEL, TOKEN_ENCODING
+from modules.pipeline_cache import code_version, file_hash, get_pipeline_cache, stage_key
+from modules import telemetry  # Per-stage spans & counters (no-op unless enabled)
+
+# Stages in order; each one's output is cached under a key derived from its input's key.
+#   extract  raw page texts (digital text, OCR for scanned pages)
+#   clean    cleaned page texts
+#   analyze  entities, terms, risk score & sentiment        (from extract: terms need the raw capitalization)
+#   chunk    token-accurate chunks (cached without their embeddings: the embedding cache holds those)
+#   index    the document's chunks in the corpus FAISS index (from chunk)
+STAGES = ("extract", "clean", "analyze", "chunk", "index")
+STAGE_MODULES = {
+    "extract": ("modules.pdf_text_extractor",),
+    "clean": ("modules.text_cleaning",),
+    "analyze": ("modules.pdf_feature_extractor", "modules.term_matcher", "modules.text_cleaning"),
+    "chunk": ("modules.text_chunker",),
+    "index": ("modules.vector_database", "modules.chunk_store", "modules.index_factory", "modules.embeddings"),
+}
+
+def _lexicon_files_digest(directory=LEXICON_DIR):
+    """Hash of the extra lexicon files, so editing a lexicon reruns the analysis."""
+    digest = hashlib.sha256()
+    if directory and os.path.isdir(directory):
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith(".txt"):
+                digest.update(filename.encode("utf-8"))
+                digest.update(file_hash(os.path.join(directory, filename)).encode("utf-8"))
+    return digest.hexdigest()
+
+def stage_configs(max_tokens=600, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """The parameters each stage's output depends on."""
+    return {
+        "extract": {"ocr_dpi": OCR_DPI, "scanned_page_threshold": SCANNED_PAGE_THRESHOLD},
+        "clean": {},
+        "analyze": {
+            "spacy_model": SPACY_MODEL,
+            "pipes": list(NER_PIPES),
+            "segment_chars": NER_SEGMENT_CHARS,
+            "lexicons": {category: sorted(terms) for category, terms in TERM_LEXICONS.items()},
+            "lexicon_files": _lexicon_files_digest(),
+            "term_text": "raw",  # Terms are matched on the raw pages, the rest on the cleaned ones
+            "acronym_lexicons": sorted(ACRONYM_LEXICONS),
+        },
+        "chunk": {
+            "max_tokens": max_tokens,
+            "overlap_tokens": overlap_tokens,
+            "spacy_model": SPACY_MODEL,
+            "pipes": list(CHUNK_PIPES),
+            "token_encoding": TOKEN_ENCODING,
+        },
+        "index": {"embedding_model": EMBEDDING_MODEL},
+    }
+
+def stage_keys(pdf_hash, configs):
+    """Every stage's cache key, computed up front from the PDF hash (no stage has to run for this)."""
+    inputs = {"extract": None, "clean": "extract", "analyze": "extract", "chunk": "clean", "index": "chunk"}
+    keys = {}
+    for stage in STAGES:
+        input_key = pdf_hash if inputs[stage] is None else keys[inputs[stage]]
+        keys[stage] = stage_key(stage, input_key, configs[stage], code_version(*STAGE_MODULES[stage]))
+    return keys
+
+def _indexed_chunks(index_path, doc_id):
+    """Number of chunks `doc_id` currently has in the corpus index (0 if it isn't there)."""
+    store_path = chunk_store_path_for(index_path)
+    if not (os.path.exists(index_path) and os.path.exists(store_path)):
+        return 0
+    store = ChunkStore(store_path, read_only=True)
+    try:
+        return store.documents().get(doc_id, 0)
+    finally:
+        store.close()
+
+def _without_embeddings(chunks):
+    """Chunks as cached: a 768-float list per chunk would duplicate the embedding cache several times over."""
+    return [{**chunk, "embedding": None} for chunk in chunks]
+
+def _index_state_key(index_path, doc_id):
+    """Cache entry remembering which chunk key an (index, document) pair currently holds."""
+    return hashlib.sha256(f"{os.path.abspath(index_path)}\0{doc_id}".encode("utf-8")).hexdigest()
+
+def prepare_document(pdf_path, doc_id=None, index_path=DEFAULT_INDEX_PATH, output_dir=None, max_tokens=600,
+                     overlap_tokens=CHUNK_OVERLAP_TOKENS, export_chunks_json=False, cache="default", on_stage=None,
+                     embed=True, ocr_workers=None):
+    """
+    Runs the stages up to chunking for one PDF, skipping every stage whose output is already
+    cached for the same PDF content, stage config and code version.
+    Stages are resolved from the end: if the chunks are cached the PDF isn't even opened, and if
+    the corpus index already holds them they aren't loaded either (`chunks` is then None).
+    :param pdf_path: Path to the PDF file
+    :param doc_id: Id of the document in the corpus index (default: the PDF filename without extension)
+    :param output_dir: Where to write `<doc_id>.txt` / `_analysis.json` (/ `_chunks.json`), if given
+    :param cache: A PipelineCache, None to run everything, or "default" for the shared cache
+    :param on_stage: Optional callback(stage, status) with status "running", "ran" or "cached"
+    :param embed: False leaves new chunks without embeddings (see `index_document`)
+    :param ocr_workers: OCR processes for this document's scanned pages
+    :return: Dict with doc_id, pdf_hash, stage keys, analysis, chunks, pages extracted, per-stage status & seconds
+    """
+    cache = get_pipeline_cache() if cache == "default" else cache
+    doc_id = doc_id or os.path.splitext(os.path.basename(pdf_path))[0]
+    pdf_hash = file_hash(pdf_path)
+    keys = stage_keys(pdf_hash, stage_configs(max_tokens, overlap_tokens))
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    status = {}
+    seconds = {}
+    values = {}  # Stage outputs still needed; each is dropped once its consumers are done
+    extracted = {"pages": 0}  # Pages this call extracted (0 if extraction was cached or not needed)
+    text_file = os.path.join(output_dir, f"{doc_id}.txt") if output_dir else None
+
+    def notify(stage, state):
+        if on_stage:
+            on_stage(stage, state)
+
+    def resolve(stage, compute, cached=None):
+        """A stage's output: from `values`, else from the cache, else computed (and cached as `cached(value)`, if given)."""
+        if stage in values:
+            return values[stage]
+        start = time.perf_counter()
+        value = cache.get(stage, keys[stage]) if cache is not None else None
+        if value is None:
+            notify(stage, "running")
+            with telemetry.span("stage", stage=stage):
+                value = compute()
+            if cache is not None:
+                cache.put(stage, keys[stage], cached(value) if cached else value)
+            status[stage] = "ran"
+        else:
+            status[stage] = "cached"
+            telemetry.count("stage_cache_hits", stage=stage)
+        seconds[stage] = time.perf_counter() - start
+        notify(stage, status[stage])
+        values[stage] = value
+        return value
+
+    def write_text(pages):
+        """Passes (page_number, text) records through, writing `<doc_id>.txt` on the way."""
+        with open(text_file or os.devnull, "w", encoding="utf-8") as f:
+            for page_number, page_text in pages:
+                f.write(page_text + "\n")
+                yield page_number, page_text
+
+    def extract():
+        pages = list(write_text(iter_pages(pdf_path, max_workers=ocr_workers)))
+        extracted["pages"] = len(pages)
+        return pages
+
+    def clean():
+        return list(clean_pages(resolve("extract", extract)))
+
+    def analyze():
+        return extract_entities_from_pages(resolve("extract", extract), clean=clean_text)
+
+    def chunk():
+        pages = resolve("clean", clean)
+        values.pop("extract", None)  # The raw pages aren't needed past cleaning & analysis
+        chunks = list(smart_chunk_pages(pages, max_tokens=max_tokens, overlap_tokens=overlap_tokens, embed=embed))
+        del values["clean"], pages
+        telemetry.count("chunks", len(chunks))
+        telemetry.count("chunk_tokens", sum(chunk["tokens"] for chunk in chunks))
+        return chunks
+
+    # Steps 1-3: analysis (a cached analysis skips extraction entirely)
+    analysis = resolve("analyze", analyze)
+    if output_dir:
+        if not os.path.exists(text_file):  # Raw pages (or the analysis) were cached: only the .txt needs the pages
+            pages = resolve("extract", extract)  # Writes the .txt itself if it extracts again
+            if not os.path.exists(text_file):
+                with open(text_file, "w", encoding="utf-8") as f:
+                    f.writelines(page_text + "\n" for _, page_text in pages)
+            del pages  # Kept in `values` until cleaning / chunking is done with it
+        with open(os.path.join(output_dir, f"{doc_id}_analysis.json"), "w", encoding="utf-8") as json_file:
+            json.dump(analysis, json_file, indent=4)
+
+    # Step 4: chunks, unless the corpus index already holds this document's current chunks.
+    # The chunk store confirms the document is still there with as many chunks as recorded.
+    indexed = cache.get("index", _index_state_key(index_path, doc_id)) if cache is not None else None
+    chunks = None
+    if indexed and indexed["key"] == keys["index"] and _indexed_chunks(index_path, doc_id) == indexed["chunks"]:
+        status["index"] = "cached"
+        telemetry.count("stage_cache_hits", stage="index")
+        notify("index", "cached")
+    if status.get("index") != "cached" or export_chunks_json:
+        chunks = resolve("chunk", chunk, cached=_without_embeddings)
+        if embed and status.get("index") != "cached":
+            ensure_embeddings(chunks)  # Cached chunks get theirs back from the embedding cache
+    if export_chunks_json and output_dir:  # Debugging export; search reads the compact chunk store
+        save_chunks_to_json(chunks, os.path.join(output_dir, f"{doc_id}_chunks.json"))
+
+    return {
+        "doc_id": doc_id,
+        "pdf_hash": pdf_hash,
+        "index_path": index_path,
+        "keys": keys,
+        "analysis": analysis,
+        "chunks": chunks if status.get("index") != "cached" else None,
+        "chunk_count": indexed["chunks"] if status.get("index") == "cached" else len(chunks),
+        "pages": extracted["pages"],
+        "status": status,
+        "seconds": seconds,
+    }
+
+def embed_document(prepared, batch_size=None):
+    """Embeds a prepared document's chunks that still lack embeddings (cached ones come from the embedding cache)."""
+    chunks = prepared["chunks"]
+    if chunks and any(not chunk.get("embedding") for chunk in chunks):
+        start = time.perf_counter()
+        with telemetry.span("stage", stage="embed"):
+            ensure_embeddings(chunks, batch_size=batch_size)
+        prepared["seconds"]["embed"] = time.perf_counter() - start
+    return prepared
+
+def index_document(prepared, corpus=None, batch_size=None, on_stage=None):
+    """
+    Adds a prepared document to the corpus index (no-op if it's already there), embedding any
+    chunks that still lack embeddings first.
+    :param corpus: An open CorpusIndex to add to (one writer for many documents), or None to open
+                   `prepared["index_path"]` just for this document
+    """
+    status, seconds = prepared["status"], prepared["seconds"]
+    if status.get("index") == "cached":
+        return prepared
+    embed_document(prepared, batch_size)
+
+    chunks = prepared["chunks"]
+    if on_stage:
+        on_stage("index", "running")
+    start = time.perf_counter()
+    with telemetry.span("stage", stage="index"):
+        if corpus is None:
+            save_to_faiss(chunks, index_path=prepared["index_path"], doc_id=prepared["doc_id"])
+        else:
+            corpus.add_document(prepared["doc_id"], chunks)
+    seconds["index"] = time.perf_counter() - start
+    status["index"] = "ran"
+    if on_stage:
+        on_stage("index", "ran")
+    return prepared
+
+def record_indexed(prepared, cache="default"):
+    """Remembers that the corpus index holds this document's current chunks (call once the index is saved)."""
+    cache = get_pipeline_cache() if cache == "default" else cache
+    if cache is not None:
+        cache.put("index", _index_state_key(prepared["index_path"], prepared["doc_id"]),
+                  {"key": prepared["keys"]["index"], "chunks": prepared["chunk_count"]})
+
+def run_pipeline(pdf_path, doc_id=None, index_path=DEFAULT_INDEX_PATH, output_dir=None, max_tokens=600,
+                 overlap_tokens=CHUNK_OVERLAP_TOKENS, export_chunks_json=False, cache="default", on_stage=None):
+    """
+    Runs extract -> clean -> analyze -> chunk -> index for one PDF, reusing every cached stage.
+    :return: Dict with doc_id, pdf_hash, analysis, chunk count, per-stage status & seconds
+    """
+    prepared = prepare_document(pdf_path, doc_id, index_path, output_dir, max_tokens, overlap_tokens,
+                                export_chunks_json, cache, on_stage)
+    index_document(prepared, on_stage=on_stage)
+    record_indexed(prepared, cache)
+    return {
+        "doc_id": prepared["doc_id"],
+        "pdf_hash": prepared["pdf_hash"],
+        "analysis": prepared["analysis"],
+        "chunks": prepared["chunk_count"],
+        "stages": {stage: prepared["status"].get(stage, "skipped") for stage in STAGES},
+        "seconds": prepared["seconds"],
+    }
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import pickle
+import sys
+import threading
+
+# Content-addressed cache of pipeline stage outputs (one pickle per stage run).
+# A stage's key hashes its input's key, its config and the source of the code that runs it,
+# so an unchanged stage is skipped and changing one parameter only reruns what comes after it.
+PIPELINE_CACHE_DIR = os.environ.get("PIPELINE_CACHE_DIR", os.path.join(".cache", "pipeline"))  # "" disables
+# Beyond this many bytes, the least recently used entries are evicted (a miss just reruns the stage)
+PIPELINE_CACHE_MAX_BYTES = int(os.environ.get("PIPELINE_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+def file_hash(path, block_size=1 << 20):
+    """SHA-256 of a file's content (read in blocks, so large PDFs aren't loaded at once)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def code_version(*module_names):
+    """SHA-256 of the source files of the given modules: editing a stage's code invalidates its outputs."""
+    digest = hashlib.sha256()
+    for name in module_names:
+        module = sys.modules.get(name) or __import__(name, fromlist=["_"])
+        with open(module.__file__, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def stage_key(stage, input_key, config, code):
+    """Content address of one stage run."""
+    payload = json.dumps({"stage": stage, "input": input_key, "config": config, "code": code}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class PipelineCache:
+    """Stage outputs stored as `<directory>/<stage>/<key>.pkl`, with a size limit, LRU eviction
+    (by file modification time, refreshed on every hit) and hit/miss stats."""
+
+    def __init__(self, directory=PIPELINE_CACHE_DIR, max_bytes=PIPELINE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size = None  # Bytes on disk as of the last scan plus what this process wrote since
+        self._lock = threading.Lock()
+
+    def _path(self, stage, key):
+        return os.path.join(self.directory, stage, f"{key}.pkl")
+
+    def contains(self, stage, key):
+        return os.path.exists(self._path(stage, key))
+
+    def get(self, stage, key, default=None):
+        """The cached output of a stage run, or `default` (a corrupt entry counts as a miss)."""
+        path = self._path(stage, key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            with self._lock:
+                self.misses += 1
+            return default
+        try:
+            os.utime(path)  # Marks the entry as recently used
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, stage, key, value):
+        """Stores a stage output atomically (readers never see a half-written entry)."""
+        path = self._path(stage, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            else:
+                self._size += os.path.getsize(path)
+            if self._size > self.max_bytes:
+                self._evict(keep=path)
+
+    def _entries(self):
+        """(last used, size, path) of every entry on disk."""
+        entries = []
+        for root, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if filename.endswith(".pkl"):
+                    path = os.path.join(root, filename)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:  # Evicted by another process meanwhile
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self, keep=None):
+        # Other processes (e.g. ingest's file workers) write here too, so rescan before evicting
+        entries = sorted(self._entries())
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, path in entries:
+            if size <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= entry_size
+            self.evictions += 1
+        self._size = size
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "size_bytes": self._size, "max_bytes": self.max_bytes}
+
+_pipeline_cache = None
+
+def get_pipeline_cache():
+    """The shared pipeline cache, or None if PIPELINE_CACHE_DIR is empty (caching disabled)."""
+    global _pipeline_cache
+    if _pipeline_cache is None and PIPELINE_CACHE_DIR:
+        _pipeline_cache = PipelineCache(PIPELINE_CACHE_DIR)
+    return _pipeline_cache
@@ -0,0 +1,236 @@
+import cProfile
+import contextvars
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+
+# In-process tracing & metrics for the pipeline:
+#   spans     timed blocks (stage runs, OCR waits, spaCy passes, embedding & Ollama requests, FAISS calls),
+#             aggregated per name + labels: count, errors, total seconds, self seconds (minus nested spans), max
+#   counters  pages, chunks, tokens, embedding requests, cache hits, ...
+# Exported as JSON or Prometheus text, and shown in the Streamlit app.
+# Disabled by default: span() then returns a shared no-op context manager and count() returns at once.
+#   TELEMETRY=1 streamlit run app.py
+#   TELEMETRY_EXPORT=metrics.prom python ingest.py data_room/        (.prom: Prometheus text, else JSON)
+#   TELEMETRY_PROFILE=stage,ner python main.py                       (one cProfile dump per run of those spans)
+# py-spy needs no hook (`py-spy record -o ingest.svg -- python ingest.py data_room/`); the .prof dumps open
+# in snakeviz or pstats.
+TELEMETRY_EXPORT = os.environ.get("TELEMETRY_EXPORT", "")
+TELEMETRY_ENABLED = os.environ.get("TELEMETRY", "0") == "1" or bool(TELEMETRY_EXPORT)
+TELEMETRY_PROFILE = {name for name in os.environ.get("TELEMETRY_PROFILE", "").split(",") if name}
+TELEMETRY_PROFILE_DIR = os.environ.get("TELEMETRY_PROFILE_DIR", os.path.join(".cache", "profiles"))
+PROMETHEUS_PREFIX = "due_diligence"
+RECENT_SPANS = 500  # Latest finished spans kept for the JSON export
+
+_enabled = TELEMETRY_ENABLED
+_lock = threading.Lock()
+_spans = {}  # (name, labels) -> aggregated timings
+_counters = {}  # (name, labels) -> value
+_recent = deque(maxlen=RECENT_SPANS)
+_current = contextvars.ContextVar("telemetry_span", default=None)  # Innermost open span of this thread / task
+_profiles_written = 0
+
+def enabled():
+    return _enabled
+
+def enable(on=True):
+    """Turns recording on (or off) for this process."""
+    global _enabled
+    _enabled = on
+
+def _key(name, labels):
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _record_span(name, labels, seconds, self_seconds, error=False):
+    key = _key(name, labels)
+    with _lock:
+        stats = _spans.get(key)
+        if stats is None:
+            stats = _spans[key] = {"count": 0, "errors": 0, "seconds": 0.0, "self_seconds": 0.0, "max_seconds": 0.0}
+        stats["count"] += 1
+        stats["errors"] += error
+        stats["seconds"] += seconds
+        stats["self_seconds"] += self_seconds
+        stats["max_seconds"] = max(stats["max_seconds"], seconds)
+        _recent.append({"name": name, "labels": dict(key[1]), "seconds": round(seconds, 6), "error": error,
+                        "end": time.time(), "thread": threading.current_thread().name})
+
+def _start_profile(name):
+    if name not in TELEMETRY_PROFILE:
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # Another profiler is already active (e.g. an enclosing profiled span)
+        return None
+    return profiler
+
+def _dump_profile(profiler, name):
+    global _profiles_written
+    profiler.disable()
+    with _lock:
+        _profiles_written += 1
+        number = _profiles_written
+    os.makedirs(TELEMETRY_PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(os.path.join(TELEMETRY_PROFILE_DIR, f"{name}-{os.getpid()}-{number}.prof"))
+
+
+class _Span:
+    """One timed block; time spent in nested spans is subtracted from its self time."""
+
+    __slots__ = ("name", "labels", "start", "children", "token", "profiler", "profiled")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.children = 0.0
+        parent = _current.get()
+        # One profiler at a time: spans nested in a profiled span are part of its dump
+        self.profiler = None if parent is not None and parent.profiled else _start_profile(self.name)
+        self.profiled = self.profiler is not None or (parent is not None and parent.profiled)
+        self.token = _current.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        if self.profiler is not None:
+            _dump_profile(self.profiler, self.name)
+        _current.reset(self.token)
+        parent = _current.get()
+        if parent is not None:
+            parent.children += seconds
+        _record_span(self.name, self.labels, seconds, seconds - self.children, error=exc_type is not None)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NOOP_SPAN = _NoopSpan()
+
+def span(name, **labels):
+    """Context manager timing a block as span `name` (labels: e.g. stage="extract")."""
+    if not _enabled:
+        return _NOOP_SPAN
+    return _Span(name, labels)
+
+def observe(name, seconds, **labels):
+    """Records a span timed elsewhere (e.g. a request on the Ollama client's event loop)."""
+    if _enabled:
+        _record_span(name, labels, seconds, seconds)
+
+def count(name, value=1, **labels):
+    """Adds `value` to counter `name`."""
+    if _enabled:
+        key = _key(name, labels)
+        with _lock:
+            _counters[key] = _counters.get(key, 0) + value
+
+# Export
+
+def snapshot(recent=False):
+    """Everything recorded so far: {"spans": [...], "counters": [...]} (+ the latest spans if `recent`)."""
+    with _lock:
+        result = {
+            "enabled": _enabled,
+            "pid": os.getpid(),
+            "spans": [
+                {"name": name, "labels": dict(labels), **{key: round(value, 6) for key, value in stats.items()}}
+                for (name, labels), stats in _spans.items()
+            ],
+            "counters": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in _counters.items()],
+        }
+        if recent:
+            result["recent"] = list(_recent)
+    result["spans"].sort(key=lambda stats: stats["self_seconds"], reverse=True)
+    return result
+
+def merge(other):
+    """Adds a snapshot taken in another process (e.g. an ingest file worker) to this one."""
+    with _lock:
+        for stats in other.get("spans", []):
+            key = _key(stats["name"], stats["labels"])
+            mine = _spans.setdefault(key, {"count": 0, "errors": 0, "seconds": 0.0, "self_seconds": 0.0, "max_seconds": 0.0})
+            for field in ("count", "errors", "seconds", "self_seconds"):
+                mine[field] += stats[field]
+            mine["max_seconds"] = max(mine["max_seconds"], stats["max_seconds"])
+        for counter in other.get("counters", []):
+            key = _key(counter["name"], counter["labels"])
+            _counters[key] = _counters.get(key, 0) + counter["value"]
+
+def reset():
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+        _recent.clear()
+
+def summary_lines(data=None, limit=10):
+    """One line per span, biggest self time first: where the time went."""
+    data = data or snapshot()
+    lines = []
+    for stats in data["spans"][:limit]:
+        labels = ", ".join(f"{key}={value}" for key, value in stats["labels"].items())
+        lines.append(f"{stats['name']}{f' ({labels})' if labels else ''}: {stats['self_seconds']:.3f} s self, "
+                     f"{stats['seconds']:.3f} s total, {stats['count']}x")
+    return lines
+
+def _metric_name(name):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", f"{PROMETHEUS_PREFIX}_{name}")
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in sorted(labels.items())) + "}"
+
+def to_prometheus(data=None):
+    """Prometheus text exposition format of a snapshot (default: the current one)."""
+    data = data or snapshot()
+    span_metrics = (
+        ("span_count_total", "counter", "count", "Finished spans"),
+        ("span_errors_total", "counter", "errors", "Spans that raised"),
+        ("span_seconds_total", "counter", "seconds", "Seconds spent in spans, nested spans included"),
+        ("span_self_seconds_total", "counter", "self_seconds", "Seconds spent in spans, nested spans excluded"),
+        ("span_max_seconds", "gauge", "max_seconds", "Longest single span"),
+    )
+    lines = []
+    for suffix, kind, field, description in span_metrics:
+        metric = _metric_name(suffix)
+        lines += [f"# HELP {metric} {description}", f"# TYPE {metric} {kind}"]
+        lines += [f"{metric}{_labels_text({'span': stats['name'], **stats['labels']})} {stats[field]}" for stats in data["spans"]]
+    counters = {}
+    for counter in data["counters"]:
+        counters.setdefault(_metric_name(f"{counter['name']}_total"), []).append(counter)
+    for metric, values in sorted(counters.items()):
+        lines.append(f"# TYPE {metric} counter")
+        lines += [f"{metric}{_labels_text(counter['labels'])} {counter['value']}" for counter in values]
+    return "\n".join(lines) + "\n"
+
+def export(path=TELEMETRY_EXPORT):
+    """Writes the current snapshot to `path` (atomically): Prometheus text for .prom, JSON otherwise."""
+    if not path:
+        return None
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        if path.endswith(".prom"):
+            f.write(to_prometheus())
+        else:
+            json.dump(snapshot(recent=True), f, indent=4)
+    os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,87 @@
+import os
+from collections import defaultdict
+import regex  # Unicode-aware word tokens
+
+# Words, tickers and identifiers ("basel iii", "mifid", "0x1f9...") as matchable tokens; hyphens and
+# apostrophes are word boundaries, so "SEC's" holds "SEC" and "anti-money laundering" "money laundering"
+TOKEN_REGEX = regex.compile(r"\w+")
+_END = "\0"  # Trie key marking "a term ends here"
+
+def tokenize(text):
+    """Word tokens (original case) with their character spans."""
+    return [(m.group(), m.start(), m.end()) for m in TOKEN_REGEX.finditer(text)]
+
+def load_lexicon_file(path):
+    """Terms from a text file: one term per line, blank lines and '#' comments ignored."""
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+def load_lexicon_dir(directory):
+    """{category: terms} for every `<category>.txt` file in a directory (e.g. sanctions.txt, tickers.txt)."""
+    lexicons = {}
+    if directory and os.path.isdir(directory):
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith(".txt"):
+                lexicons[filename[:-4]] = load_lexicon_file(os.path.join(directory, filename))
+    return lexicons
+
+
+class TermMatcher:
+    """Case-insensitive, word-boundary matcher for many lexicons at once. In the `acronym`
+    categories (regulations, tickers), ALL-CAPS terms only match ALL-CAPS text: "SEC" and
+    "SEC's" but not "Sec. 5", while "Bitcoin" or "staking" still match any case.
+
+    Terms are stored in a trie of lowercased tokens, so a text is scanned once and the cost
+    depends on the text length (and longest term), not on how many terms the lexicons hold.
+    """
+
+    def __init__(self, lexicons=None, acronym=()):
+        self._trie = {}
+        self.acronym = set(acronym)
+        self.categories = []
+        for category, terms in (lexicons or {}).items():
+            self.add_terms(category, terms)
+
+    def add_terms(self, category, terms):
+        """Adds terms to a category (the original spelling is what gets reported)."""
+        if category not in self.categories:
+            self.categories.append(category)
+        for term in terms:
+            tokens = [token.lower() for token, _, _ in tokenize(term)]
+            if not tokens:
+                continue
+            node = self._trie
+            for token in tokens:
+                node = node.setdefault(token, {})
+            entry = (category, term, category in self.acronym and term.isupper())
+            entries = node.setdefault(_END, [])
+            if entry not in entries:
+                entries.append(entry)
+
+    def find(self, text):
+        """All matches as (category, term, start, end), overlapping ones included."""
+        spans = tokenize(text)
+        tokens = [token.lower() for token, _, _ in spans]
+        matches = []
+        for i, token in enumerate(tokens):
+            node = self._trie.get(token)
+            j = i
+            while node is not None:
+                for category, term, caps_only in node.get(_END, ()):
+                    start, end = spans[i][1], spans[j][2]
+                    if not (caps_only and any(char.islower() for char in text[start:end])):
+                        matches.append((category, term, start, end))
+                j += 1
+                if j == len(tokens):
+                    break
+                node = node.get(tokens[j])
+        return matches
+
+    def count(self, text):
+        """{category: {term: {"count": n, "positions": [start offsets]}}} from a single pass."""
+        counts = {category: defaultdict(lambda: {"count": 0, "positions": []}) for category in self.categories}
+        for category, term, start, _ in self.find(text):
+            entry = counts[category][term]
+            entry["count"] += 1
+            entry["positions"].append(start)
+        return {category: dict(terms) for category, terms in counts.items()}
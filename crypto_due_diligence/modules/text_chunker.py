@@ -1,26 +1,24 @@
-import spacy
 import re
 import json
-import tiktoken
-import ollama  # ✅ Use Ollama API for Nomic embedding
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from bisect import bisect_left, bisect_right
+from modules.nlp_models import get_spacy_model, get_tokenizer, pipes_except, CHUNK_PIPES, NER_PIPES  # Lazily loaded, shared models
+from modules.embeddings import embed_text, embed_texts  # ✅ Shared, batched Nomic embeddings
 from modules.vector_database import save_to_faiss  # FAISS Vector Database Storage
-
-# Load NLP Model
-nlp = spacy.load("en_core_web_lg")
+from modules import telemetry  # Tokenizer / spaCy spans & token counts (no-op unless enabled)
 
 # Define important entities to preserve
 IMPORTANT_ENTITIES = {"ORG", "GPE", "MONEY", "LAW", "EVENT", "DATE", "PRODUCT", "PERCENT", "CARDINAL"}
+CHUNK_OVERLAP_TOKENS = 50  # A short last sentence is repeated at the start of the next chunk
 
 def extract_important_phrases(text):
     """Extracts key entities (company names, laws, financial data) to avoid splitting them."""
-    doc = nlp(text)
+    nlp = get_spacy_model()
+    doc = nlp(text, disable=pipes_except(nlp, NER_PIPES))
     return {ent.text for ent in doc.ents if ent.label_ in IMPORTANT_ENTITIES}
 
 def count_tokens(text):
     """Counts tokens using OpenAI tokenizer."""
-    enc = tiktoken.get_encoding("cl100k_base")
-    return len(enc.encode(text))
+    return len(get_tokenizer().encode(text))
 
 def preprocess_text(text):
     """Prepares text by removing the Table of Contents and normalizing spacing."""
@@ -39,30 +37,167 @@ def preprocess_text(text):
 
 def get_embedding(text):
     """Generates embeddings using the locally installed Nomic Embed model via Ollama."""
-    response = ollama.embeddings(model="nomic-embed-text", prompt=text)  # ✅ FIXED
-    return response["embedding"]  # ✅ Extract embedding
-
-def smart_chunk_text(text, max_tokens=600):
-    """Splits text into meaningful sections while keeping chunks under the token limit."""
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=max_tokens, chunk_overlap=50  # Overlap ensures sentence continuity
-    )
-
+    return embed_text(text)
+
+def plan_chunks(token_offsets, sentences, entities, max_tokens=600, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Groups sentences into chunks of at most `max_tokens` tokens without cutting an entity.
+    Sentences split inside an entity are merged; a sentence longer than `max_tokens` is cut at
+    the last token boundary that isn't inside an entity. Runs in time linear in the text.
+    :param token_offsets: Character offset where each token of the text starts (one encoder pass)
+    :param sentences: Sorted (start_char, end_char) sentence spans
+    :param entities: Sorted, non-overlapping (start_char, end_char) spans that must stay whole
+    :return: List of (start_char, end_char, token_count)
+    """
+    entity_starts = [start for start, _ in entities]
+
+    def tokens_between(start, end):
+        return bisect_left(token_offsets, end) - bisect_left(token_offsets, start)
+
+    def inside_entity(position):
+        i = bisect_right(entity_starts, position) - 1
+        return i >= 0 and entities[i][0] < position < entities[i][1]
+
+    # Sentence units: never start a unit inside an entity, never exceed the token budget
+    units = []
+    for start, end in sentences:
+        if units and inside_entity(start):
+            units[-1] = (units[-1][0], end)
+        else:
+            units.append((start, end))
+
+    bounded_units = []
+    for start, end in units:
+        while tokens_between(start, end) > max_tokens:
+            first = bisect_left(token_offsets, start)
+            cut_index = first + max_tokens
+            while cut_index > first and inside_entity(token_offsets[cut_index]):
+                cut_index -= 1
+            if cut_index == first:  # An entity longer than the budget: cut it anyway
+                cut_index = first + max_tokens
+            bounded_units.append((start, token_offsets[cut_index]))
+            start = token_offsets[cut_index]
+        bounded_units.append((start, end))
+
+    # Greedy packing of units into chunks
+    spans = []
+    chunk_start, previous = None, None
+    for start, end in bounded_units:
+        if chunk_start is None:
+            chunk_start = start
+        elif tokens_between(chunk_start, end) > max_tokens:
+            spans.append((chunk_start, previous[1]))
+            overlap = (
+                overlap_tokens
+                and previous[0] > chunk_start
+                and tokens_between(previous[0], previous[1]) <= overlap_tokens
+                and tokens_between(previous[0], end) <= max_tokens
+            )
+            chunk_start = previous[0] if overlap else start
+        previous = (start, end)
+    if chunk_start is not None:
+        spans.append((chunk_start, previous[1]))
+
+    return [(start, end, tokens_between(start, end)) for start, end in spans]
+
+def chunk_spans(text, max_tokens=600, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """Parses `text` once with spaCy and encodes it once, then plans token-accurate chunk spans."""
+    tokenizer = get_tokenizer()
+    with telemetry.span("tokenize"):
+        _, token_offsets = tokenizer.decode_with_offsets(tokenizer.encode(text))
+    telemetry.count("tokens", len(token_offsets))
+    with telemetry.span("spacy", task="chunk"):
+        nlp = get_spacy_model()
+        doc = nlp(text, disable=pipes_except(nlp, CHUNK_PIPES))
+    sentences = [(sent.start_char, sent.end_char) for sent in doc.sents]
+    entities = [(ent.start_char, ent.end_char) for ent in doc.ents if ent.label_ in IMPORTANT_ENTITIES]
+    return plan_chunks(token_offsets, sentences, entities, max_tokens, overlap_tokens)
+
+def _build_chunks(text, spans, offset, page_starts, page_numbers, first_chunk_id, batch_size, embed=True):
+    """Turns chunk spans of `text` into chunk dicts with document offsets, page range & embeddings."""
+    def page_at(position):
+        return page_numbers[bisect_right(page_starts, position) - 1] if page_starts else None
+
+    texts = [text[start:end] for start, end, _ in spans]
+    # ✅ One Ollama call per batch (or none: the caller embeds later, e.g. concurrently)
+    embeddings = embed_texts(texts, batch_size=batch_size) if embed else [None] * len(texts)
     chunks = []
-    split_texts = splitter.split_text(text)
-
-    for i, chunk in enumerate(split_texts):
+    for i, ((start, end, tokens), chunk_text, embedding) in enumerate(zip(spans, texts, embeddings)):
         chunks.append({
-            "chunk_id": i + 1,
-            "text": chunk,
-            "tokens": count_tokens(chunk),
-            "embedding": get_embedding(chunk)  # ✅ Call Ollama for embedding
+            "chunk_id": first_chunk_id + i,
+            "text": chunk_text,
+            "tokens": tokens,
+            "start_char": offset + start,
+            "end_char": offset + end,
+            "page_start": page_at(offset + start),
+            "page_end": page_at(offset + end - 1),
+            "embedding": embedding
         })
-
     return chunks
 
-def save_chunks_to_json(chunks, filename):
-    """Save chunked text into structured JSON."""
+def _pieces(text, size):
+    """Cuts a very long page at whitespace so the parser never sees more than ~`size` characters."""
+    start = 0
+    while len(text) - start > size:
+        cut = text.rfind(" ", start + size // 2, start + size)
+        cut = cut + 1 if cut != -1 else start + size
+        yield text[start:cut]
+        start = cut
+    yield text[start:]
+
+def smart_chunk_pages(pages, max_tokens=600, batch_size=None, window_chunks=32, overlap_tokens=CHUNK_OVERLAP_TOKENS,
+                      embed=True):
+    """Chunks a stream of (page_number, text) records into chunks of at most `max_tokens` tokens,
+    keeping sentences & entities whole and recording each chunk's character offsets & page range.
+
+    Text is buffered only until about `window_chunks` chunks are ready; those are embedded as
+    a batch and yielded, so memory stays bounded on very large documents. Offsets refer to the
+    pages joined with newlines. With `embed=False` chunks carry `"embedding": None`.
+    """
+    flush_size = max_tokens * 4 * window_chunks  # ~4 characters per token
+
+    buffer, buffer_start, document_length = "", 0, 0
+    page_starts, page_numbers = [], []  # Where each page begins in the joined document
+    next_chunk_id = 1
+
+    for page_number, text in pages:
+        if document_length:
+            buffer += "\n"
+            document_length += 1
+        page_starts.append(document_length)
+        page_numbers.append(page_number)
+
+        for piece in _pieces(text, flush_size):
+            buffer += piece
+            document_length += len(piece)
+            if len(buffer) < flush_size:
+                continue
+
+            spans = chunk_spans(buffer, max_tokens, overlap_tokens)
+            if len(spans) < 2:
+                continue
+            # The last chunk may continue on the next page: keep it in the buffer
+            ready, carry = spans[:-1], spans[-1][0]
+            yield from _build_chunks(buffer, ready, buffer_start, page_starts, page_numbers, next_chunk_id, batch_size, embed)
+            next_chunk_id += len(ready)
+            buffer, buffer_start = buffer[carry:], buffer_start + carry
+
+    if buffer.strip():
+        spans = chunk_spans(buffer, max_tokens, overlap_tokens)
+        yield from _build_chunks(buffer, spans, buffer_start, page_starts, page_numbers, next_chunk_id, batch_size, embed)
+
+def smart_chunk_text(text, max_tokens=600, batch_size=None):
+    """Splits text into sentence/entity-preserving chunks of at most `max_tokens` tokens.
+
+    Embeddings are requested in batches of `batch_size` chunks and stored on each chunk,
+    so `save_to_faiss` can reuse them instead of embedding the text again.
+    """
+    return list(smart_chunk_pages([(None, text)], max_tokens=max_tokens, batch_size=batch_size))
+
+def save_chunks_to_json(chunks, filename, include_embeddings=False):
+    """Save chunked text into structured JSON (debugging export; the index reads the chunk store)."""
+    if not include_embeddings:
+        chunks = [{k: v for k, v in chunk.items() if k != "embedding"} for chunk in chunks]
     with open(filename, "w", encoding="utf-8") as json_file:
         json.dump(chunks, json_file, indent=4)
     print(f"✅ Chunks saved to {filename}")
@@ -1,9 +1,5 @@
 import re
 import unicodedata
-import spacy
-
-# Load spaCy for NLP processing
-nlp = spacy.load("en_core_web_sm")
 
 def clean_text(text):
     """
@@ -34,6 +30,11 @@ def clean_text(text):
 
     return cleaned_text
 
+def clean_pages(pages):
+    """Cleans a stream of (page_number, text) records one page at a time."""
+    for page_number, text in pages:
+        yield page_number, clean_text(text)
+
 # ✅ Test the function
 if __name__ == "__main__":
     sample_text = "Bitcoin is a decentralized digital currency, but it has been used in fraud cases! SEC's approval of ETFs was a game-changer."
@@ -1,69 +1,483 @@
+import os
+import re
+import time
+import threading
 import faiss
 import numpy as np
-import json
-import ollama  # ✅ Using Ollama for embeddings & chat response
+from modules.chunk_store import ChunkStore, chunk_store_path_for  # Compact chunk metadata (SQLite)
+from modules.embeddings import embed_text, embed_texts, get_client  # ✅ Shared Ollama client & batched embeddings
+from modules.answer_cache import get_answer_cache, scope_key  # Reuses answers to repeated questions
+from modules.index_factory import build_index, export_vectors, index_bytes, mmap_flags, search_params, supports_removal
+from modules import telemetry  # FAISS / retrieval / answer spans & counters (no-op unless enabled)
 
 VECTOR_SIZE = 768  # Nomic embedding output size
+DEFAULT_INDEX_PATH = "test_pdfs/extracted/embeddings.index"  # One corpus index for every ingested document
+FAISS_MMAP = os.environ.get("FAISS_MMAP", "1") == "1"  # Retrievers memory-map the index read-only
+# New vectors wait in the chunk store until there are this many, or this fraction of the index file's,
+# then the file is rewritten with them (compaction)
+INDEX_DELTA_MIN = int(os.environ.get("INDEX_DELTA_MIN", "20000"))
+INDEX_DELTA_FRACTION = 0.1
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "3000"))  # Chunk tokens sent to the LLM per question
+DUPLICATE_SIMILARITY = 0.8  # Chunks whose word 5-gram Jaccard similarity reaches this are near-duplicates
+SEARCH_CANDIDATES = 3  # Chunks retrieved per requested chunk, so packing has spares for dropped duplicates
+CHAT_MODEL = "llama3.1"
+RRF_K = 60  # Reciprocal rank fusion constant: score = sum of 1 / (RRF_K + rank) over the result lists
+# Identifier-like words: numbers / CIKs, hex wallet addresses, acronyms & tickers ("MiCA", "FATCA", "BTC")
+IDENTIFIER_REGEX = re.compile(r"^(?:0x[0-9a-fA-F]+|\w*\d\w*|[A-Z][A-Za-z]*[A-Z][A-Za-z]*)$")
+IDENTIFIER_QUERY_MAX_WORDS = 4
 
 def generate_embedding(text):
     """Generates Nomic embeddings using Ollama."""
-    response = ollama.embeddings(model="nomic-embed-text", prompt=text)  # ✅ Ensure input is a string
- # ✅ Ensure input is a list
-    return response["embedding"]
+    return embed_text(text)
 
-def save_to_faiss(chunks, index_path="test_pdfs/extracted/embeddings.index"):
-    """Stores chunk embeddings in a FAISS vector database."""
-    embeddings = np.array([generate_embedding(chunk["text"]) for chunk in chunks], dtype=np.float32)
+def is_identifier_query(query):
+    """True for short lookups made only of identifiers ("CIK 0001234567", "MiCA", "0x1f9a..."),
+    which the lexical index answers better than embeddings."""
+    words = [word.strip(".,;:?!\"'()[]") for word in query.split()]
+    words = [word for word in words if word]
+    return 0 < len(words) <= IDENTIFIER_QUERY_MAX_WORDS and all(IDENTIFIER_REGEX.match(word) for word in words)
 
-    # ✅ Ensure correct FAISS index handling
-    index = faiss.IndexFlatL2(VECTOR_SIZE)
-    index.add(embeddings)
+def reciprocal_rank_fusion(*rankings, k=RRF_K):
+    """Merges ranked id lists into one ranking: [(id, fused score)], best first."""
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
 
-    # Save FAISS index
-    faiss.write_index(index, index_path)
-    print(f"✅ FAISS vector database saved to {index_path}")
+def ensure_embeddings(chunks, batch_size=None):
+    """Embeds (in batches) only the chunks that don't already carry an embedding."""
+    missing = [chunk for chunk in chunks if not chunk.get("embedding")]
+    if missing:
+        embeddings = embed_texts([chunk["text"] for chunk in missing], batch_size=batch_size)
+        for chunk, embedding in zip(missing, embeddings):
+            chunk["embedding"] = embedding
+    return chunks
 
-    # Save chunk metadata (IDs to text mapping)
-    metadata_path = index_path.replace(".index", "_metadata.json")
-    with open(metadata_path, "w", encoding="utf-8") as f:
-        json.dump(chunks, f, indent=4)
+def new_faiss_index(dim=VECTOR_SIZE):
+    """Empty exact index whose vectors are addressed by chunk-store ids (supports add & remove)."""
+    return faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
 
-def load_faiss_index(index_path="test_pdfs/extracted/embeddings.index"):
-    """Loads the FAISS vector database."""
+def load_faiss_index(index_path=DEFAULT_INDEX_PATH, mmap=False):
+    """Loads the FAISS vector database.
+
+    With `mmap=True` the index is memory-mapped read-only where its type supports it, so
+    processes share one page-cached copy and cold start doesn't read the whole file.
+    """
+    flags = mmap_flags(index_path) if mmap else 0
+    if flags:
+        try:
+            return faiss.read_index(index_path, flags)
+        except RuntimeError as e:
+            print(f"⚠️ Can't memory-map {index_path} ({e}), reading it into memory instead")
     return faiss.read_index(index_path)
 
-def search_faiss(query, k=5, index_path="test_pdfs/extracted/embeddings.index"):
-    """Searches FAISS for relevant document chunks and generates an LLM response."""
-    index = load_faiss_index(index_path)
 
-    # ✅ Fix query embedding issue
-    query_embedding = np.array(generate_embedding(query), dtype=np.float32).reshape(1, -1)
+class CorpusIndex:
+    """Writable multi-document corpus (FAISS index + chunk store), updated one document at a time.
+
+    Adding or removing a document only writes its rows to the chunk store: new vectors are kept
+    there as pending and removed ones as tombstones, which retrievers search alongside the index
+    file. The file is read & rewritten (compaction) only once the pending vectors outgrow
+    INDEX_DELTA_MIN / INDEX_DELTA_FRACTION of it, so the amortized cost per vector stays constant.
+    """
+
+    def __init__(self, index_path=DEFAULT_INDEX_PATH):
+        self.index_path = index_path
+        self.store = ChunkStore(chunk_store_path_for(index_path))
+        self.index = None  # Loaded only to compact or rebuild
+        self.merged = None  # (pending ids, removed ids) applied to `index` but not written yet
+        self.dirty = False
+
+    def add_document(self, doc_id, chunks, batch_size=None):
+        """Adds (or replaces) one document; the work done is proportional to its chunks only."""
+        ensure_embeddings(chunks, batch_size=batch_size)
+        self.remove_document(doc_id)
+
+        embeddings = np.array([chunk["embedding"] for chunk in chunks], dtype=np.float32)
+        with telemetry.span("chunk_store_add"):
+            faiss_ids = self.store.add_chunks(doc_id, chunks, embeddings)
+        telemetry.count("documents_indexed")
+        telemetry.count("chunks_indexed", len(chunks))
+        return faiss_ids
+
+    def remove_document(self, doc_id):
+        """Removes a document's vectors and chunks; returns how many chunks were removed."""
+        return len(self.store.remove_document(doc_id))
+
+    def needs_compaction(self):
+        """True once the pending vectors should move into the index file (or there's no file yet)."""
+        if not os.path.exists(self.index_path):
+            return True
+        pending = self.store.pending_count()
+        indexed = len(self.store) - pending  # Live vectors in the file (tombstones aside)
+        return pending >= max(INDEX_DELTA_MIN, INDEX_DELTA_FRACTION * indexed)
+
+    def merge_delta(self):
+        """Loads the index file and applies the pending vectors & tombstones to it, in memory."""
+        pending_ids, vectors = self.store.pending_vectors()
+        removed_ids = np.array(self.store.removed_ids(), dtype=np.int64)
+        if self.index is None:
+            if os.path.exists(self.index_path):
+                self.index = load_faiss_index(self.index_path)
+            else:
+                self.index = new_faiss_index(vectors.shape[1] if len(vectors) else VECTOR_SIZE)
+        if supports_removal(self.index):
+            # Pending ids too: after a compaction interrupted between writing the file and clearing
+            # the store, the file may already hold some of them
+            stale = np.concatenate([pending_ids, removed_ids])
+            if len(stale):
+                self.index.remove_ids(faiss.IDSelectorBatch(stale))
+        elif len(removed_ids):
+            # HNSW can't drop vectors: retrievers keep skipping them until the next rebuild
+            telemetry.count("index_tombstones", len(removed_ids))
+            print(f"⚠️ {len(removed_ids)} removed vectors left as tombstones; run rebuild_faiss_index to compact")
+            removed_ids = removed_ids[:0]
+        if len(pending_ids):
+            with telemetry.span("faiss_add"):
+                self.index.add_with_ids(vectors, pending_ids)
+        self.merged = (pending_ids, removed_ids)
+        self.dirty = True
+        return self.index
+
+    def rebuild(self, index_type, nlist=None, pq_m=64, hnsw_m=32):
+        """Rebuilds the index as `index_type`, training on a sample of the vectors already stored."""
+        if self.merged is None:
+            self.merge_delta()
+        vectors, ids = export_vectors(self.index)
+        live = np.isin(ids, np.array(self.store.faiss_ids(), dtype=np.int64))  # Drop tombstones
+        self.index = build_index(index_type, vectors[live], ids[live], nlist=nlist, pq_m=pq_m, hnsw_m=hnsw_m)
+        self.merged = (self.merged[0], np.array(self.store.removed_ids(), dtype=np.int64))
+        return self.index
+
+    def documents(self):
+        """{doc_id: number of chunks} for the whole corpus."""
+        return self.store.documents()
+
+    def save(self):
+        """Compacts if it's due (or the index was rebuilt): writes the index file atomically, so warm
+        retrievers never read a half-written file, then drops the pending vectors it now holds."""
+        if not self.dirty:
+            if not self.needs_compaction():
+                return
+            self.merge_delta()
+        tmp_path = self.index_path + ".tmp"
+        with telemetry.span("faiss_save"):
+            faiss.write_index(self.index, tmp_path)
+            os.replace(tmp_path, self.index_path)
+        self.store.clear_delta(*self.merged)
+        self.merged = None
+        self.dirty = False
+
+    def close(self):
+        self.save()
+        self.store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_write_locks = {}
+_write_locks_lock = threading.Lock()
+
+def write_lock(index_path):
+    """Lock serializing this process's writers of one index: two CorpusIndex saves at once would each
+    compact their own view of the file, and the last one written would drop the other's documents."""
+    with _write_locks_lock:
+        return _write_locks.setdefault(os.path.abspath(index_path), threading.Lock())
+
+def save_to_faiss(chunks, index_path=DEFAULT_INDEX_PATH, batch_size=None, doc_id="default"):
+    """Adds (or replaces) one document's chunks in the corpus index, reusing embeddings already on the chunks."""
+    ensure_embeddings(chunks, batch_size=batch_size)  # Outside the lock: other documents can be written meanwhile
+    with write_lock(index_path), CorpusIndex(index_path) as corpus:
+        corpus.add_document(doc_id, chunks, batch_size=batch_size)
+
+def rebuild_faiss_index(index_type, index_path=DEFAULT_INDEX_PATH, nlist=None, pq_m=64, hnsw_m=32):
+    """Rebuilds the corpus index as flat / ivf_flat / hnsw / ivf_pq / ivf_sq8 (see modules.index_factory)."""
+    with write_lock(index_path), CorpusIndex(index_path) as corpus:
+        index = corpus.rebuild(index_type, nlist=nlist, pq_m=pq_m, hnsw_m=hnsw_m)
+        size = index_bytes(index)
+    print(f"✅ Rebuilt {index_path} as {index_type}: {index.ntotal} vectors, {size / max(index.ntotal, 1):.0f} bytes/vector")
+    return index
+
+def remove_from_faiss(doc_id, index_path=DEFAULT_INDEX_PATH):
+    """Removes one document from the corpus index."""
+    with write_lock(index_path), CorpusIndex(index_path) as corpus:
+        removed = corpus.remove_document(doc_id)
+    print(f"🗑️ Removed {removed} chunks of {doc_id} from {index_path}")
+    return removed
+
+
+class FaissRetriever:
+    """Long-lived handle on a FAISS index and its chunk store, reloaded only when they change.
+    Vectors not compacted into the index file yet are searched from a small in-memory delta index."""
+
+    def __init__(self, index_path, mmap=FAISS_MMAP):
+        self.index_path = index_path
+        self.mmap = mmap
+        self.store = ChunkStore(chunk_store_path_for(index_path), read_only=mmap)
+        self.index = None
+        self.delta = None  # Pending vectors of the chunk store (exact search)
+        self.removed = np.empty(0, dtype=np.int64)  # Tombstones: ids the index file holds but the store removed
+        self.live = 0  # Chunks in the store, i.e. vectors searched minus tombstones
+        self.version = None
+        self.loads = 0
+        self._lock = threading.Lock()
+
+    def _file_version(self):
+        """(mtime, size) of the index file plus the store's write counter; any change triggers a reload."""
+        stat = os.stat(self.index_path)
+        return (stat.st_mtime_ns, stat.st_size, self.store.version())
+
+    def refresh(self):
+        """Loads the index on first use, or again if it changed on disk (chunks are read lazily).
+        A change to the store alone only reloads the pending vectors & tombstones."""
+        version = self._file_version()
+        if version != self.version:
+            with self._lock:
+                if version != self.version:
+                    if self.version is None or version[:2] != self.version[:2]:
+                        # Writers replace the file atomically, so an existing mapping stays valid until swapped
+                        self.index = load_faiss_index(self.index_path, mmap=self.mmap)
+                        self.loads += 1
+                    if self.version is None or version[2] != self.version[2]:
+                        pending_ids, vectors = self.store.pending_vectors()
+                        delta = None
+                        if len(pending_ids):
+                            delta = new_faiss_index(vectors.shape[1])
+                            delta.add_with_ids(vectors, pending_ids)
+                        self.delta = delta
+                        self.removed = np.array(self.store.removed_ids(), dtype=np.int64)
+                        self.live = len(self.store)
+                    self.version = version
+        return self
+
+    @property
+    def ntotal(self):
+        """Live vectors: the index file's plus the pending ones, tombstones excluded."""
+        return self.live
+
+    def dense_search(self, query_embedding, k, allowed_ids=None):
+        """Top-k (id, L2 distance) over the index file and the pending vectors, skipping tombstones
+        (and, with `allowed_ids`, every other id)."""
+        hits = {}
+        for index, removed in ((self.index, self.removed), (self.delta, None)):
+            if index is None or index.ntotal == 0:
+                continue
+            selector = excluded = None
+            if allowed_ids is not None:
+                selector = faiss.IDSelectorBatch(allowed_ids)
+            elif removed is not None and len(removed):
+                excluded = faiss.IDSelectorBatch(removed)  # Kept referenced while the search runs
+                selector = faiss.IDSelectorNot(excluded)
+            params = search_params(index, selector)  # nprobe / efSearch for ANN indexes
+            distances, indices = index.search(query_embedding, min(k, index.ntotal), params=params)
+            for distance, i in zip(distances[0], indices[0]):
+                # An id can be in both right after a compaction: keep its best distance
+                if i >= 0 and (int(i) not in hits or distance < hits[int(i)]):
+                    hits[int(i)] = float(distance)
+        return sorted(hits.items(), key=lambda hit: hit[1])[:k]
+
+    def search(self, query, k=5, doc_ids=None, query_embedding=None, timings=None):
+        """Returns the top-k chunks for a query: BM25 hits from the chunk store's inverted index and
+        dense FAISS hits, merged by reciprocal rank fusion. Each chunk carries its fused `rrf` score,
+        plus its L2 `distance` and/or `bm25` score from the lists it was found in.
+
+        Identifier lookups with lexical hits are answered from the inverted index alone, without
+        embedding the query. If `doc_ids` is given, only chunks of those documents are considered.
+        A `query_embedding` computed by the caller is used instead of embedding `query` again.
+        The retrieval path and per-step milliseconds are added to the caller's `timings` dict, if given.
+        """
+        self.refresh()
+        if self.ntotal == 0:
+            return []
+
+        allowed_ids = None
+        if doc_ids is not None:
+            allowed_ids = np.array(self.store.ids_for_documents(doc_ids), dtype=np.int64)
+            if not len(allowed_ids):
+                return []
+
+        start = time.perf_counter()
+        lexical_hits = self.store.lexical_search(query, k, doc_ids=doc_ids)
+        lexical_done = time.perf_counter()
+
+        dense_hits = []
+        embedded = searched = lexical_done
+        if query_embedding is not None or not (lexical_hits and is_identifier_query(query)):
+            if query_embedding is None:
+                query_embedding = generate_embedding(query)
+            query_embedding = np.array(query_embedding, dtype=np.float32).reshape(1, -1)
+            embedded = time.perf_counter()
+            dense_hits = self.dense_search(query_embedding, k, allowed_ids)
+            searched = time.perf_counter()
+
+        fused = reciprocal_rank_fusion([i for i, _ in dense_hits], [i for i, _ in lexical_hits])[:k]
+        chunks = self.store.get_many([i for i, _ in fused])  # Only the top-k rows are read
+        distance_by_id, bm25_by_id, rrf_by_id = dict(dense_hits), dict(lexical_hits), dict(fused)
+        for chunk in chunks:
+            faiss_id = chunk["faiss_id"]
+            chunk["rrf"] = rrf_by_id[faiss_id]
+            if faiss_id in distance_by_id:
+                chunk["distance"] = distance_by_id[faiss_id]
+            if faiss_id in bm25_by_id:
+                chunk["bm25"] = bm25_by_id[faiss_id]
+
+        call_timings = {
+            "retrieval": ("hybrid" if lexical_hits else "dense") if dense_hits else "lexical",
+            "lexical_ms": (lexical_done - start) * 1000,
+            "embed_ms": (embedded - lexical_done) * 1000,
+            "search_ms": (searched - embedded) * 1000,
+            "lookup_ms": (time.perf_counter() - searched) * 1000,
+        }
+        telemetry.observe("lexical_search", lexical_done - start)
+        if dense_hits:
+            telemetry.observe("faiss_search", searched - embedded)
+        telemetry.count("retrievals", retrieval=call_timings["retrieval"])
+        if timings is not None:
+            timings.update(call_timings)
+        return chunks
+
+
+def format_chunk(chunk):
+    """Chunk text prefixed with its page range, so answers can cite pages."""
+    page_start, page_end = chunk.get("page_start"), chunk.get("page_end")
+    if page_start is None:
+        return chunk["text"]
+    pages = f"p. {page_start}" if page_end in (None, page_start) else f"pp. {page_start}-{page_end}"
+    return f"[{pages}] {chunk['text']}"
+
+
+_retrievers = {}
+_retrievers_lock = threading.Lock()
+
+def get_retriever(index_path=DEFAULT_INDEX_PATH):
+    """Returns the warm, process-wide retriever for an index path."""
+    with _retrievers_lock:
+        retriever = _retrievers.get(index_path)
+        if retriever is None:
+            retriever = _retrievers[index_path] = FaissRetriever(index_path)
+    return retriever.refresh()
+
+def shingles(text, n=5):
+    """Set of lowercased word n-grams, punctuation ignored (the whole text if it has fewer than n words)."""
+    words = re.findall(r"\w+", text.lower())
+    return {tuple(words[i:i + n]) for i in range(max(1, len(words) - n + 1))}
+
+def pack_context(chunks, token_budget=CONTEXT_TOKEN_BUDGET, duplicate_similarity=DUPLICATE_SIMILARITY, max_chunks=None):
+    """
+    Picks chunks in rank order until the token budget is spent, skipping near-duplicates of chunks
+    already picked (same boilerplate on many pages, overlapping chunks) and chunks that don't fit.
+    Uses each chunk's stored token count, so nothing is re-tokenized per question.
+    :return: (packed chunks, stats with tokens used & chunks dropped)
+    """
+    packed, packed_shingles = [], []
+    tokens_used = duplicates = over_budget = 0
+    for chunk in chunks:
+        if max_chunks is not None and len(packed) >= max_chunks:
+            break
+        tokens = chunk.get("tokens") or len(chunk["text"]) // 4  # ~4 characters per token if unknown
+        if tokens_used + tokens > token_budget:
+            over_budget += 1
+            continue
+        chunk_shingles = shingles(chunk["text"])
+        if any(len(chunk_shingles & other) / len(chunk_shingles | other) >= duplicate_similarity for other in packed_shingles):
+            duplicates += 1
+            continue
+        packed.append(chunk)
+        packed_shingles.append(chunk_shingles)
+        tokens_used += tokens
+    return packed, {"context_tokens": tokens_used, "chunks_used": len(packed), "duplicates_dropped": duplicates,
+                    "over_budget_dropped": over_budget}
+
+def build_messages(query, chunks):
+    """Chat messages asking the LLM to answer `query` from the packed chunks."""
+    context_text = " ".join(format_chunk(chunk) for chunk in chunks).replace("\n", " ")  # Ensure smooth formatting
+    return [
+        {"role": "system", "content": "You are an AI that provides precise answers based on retrieved document content. Cite the page numbers given in brackets when they are available."},
+        {"role": "user", "content": f"Here is relevant text from the document:\n\n{context_text}\n\nUser Question: {query}\n\nProvide a clear and structured response:"}
+    ]
+
+def stream_answer(query, k=5, index_path=DEFAULT_INDEX_PATH, doc_ids=None, token_budget=CONTEXT_TOKEN_BUDGET,
+                  timings=None):
+    """
+    Answers a question from the corpus, yielding the answer piece by piece as the LLM generates it.
+    Up to `k` retrieved chunks are packed into `token_budget` tokens of context. Time to first
+    token, total latency and packing stats are added to `timings`, a dict the caller passes per
+    question (the retriever is shared by every session, so it keeps none).
+    Answers to repeated (or near-duplicate) questions on an unchanged index come from the answer cache.
+    """
+    start = time.perf_counter()
+    timings = {} if timings is None else timings
+    retriever = get_retriever(index_path)
 
     # ✅ Fix FAISS search dimension mismatch
-    if index.ntotal == 0:
-        return ["⚠️ No embeddings found in FAISS. Ensure embeddings were generated correctly."]
+    if retriever.ntotal == 0:
+        yield "⚠️ No embeddings found in FAISS. Ensure embeddings were generated correctly."
+        return
+
+    cache = get_answer_cache()
+    version = "|".join(str(part) for part in retriever.version)
+    scope = scope_key(index_path, doc_ids=sorted(doc_ids) if doc_ids is not None else None, k=k,
+                      token_budget=token_budget, model=CHAT_MODEL)
+
+    def cached_answer(answer, kind):
+        elapsed = (time.perf_counter() - start) * 1000
+        timings.update(answer_cache=kind, ttft_ms=elapsed, total_ms=elapsed, llm_ms=0.0)
+        telemetry.count("answers", source=f"{kind}_cache")
+        return answer
 
-    # Search for top-k results
-    distances, indices = index.search(query_embedding, k)
-
-    # Load metadata to get text chunks
-    metadata_path = index_path.replace(".index", "_metadata.json")
-    with open(metadata_path, "r") as f:
-        chunks = json.load(f)
-
-    # ✅ Fix: Ensure retrieved text is properly formatted into full sentences
-    retrieved_chunks = [chunks[i]["text"] for i in indices[0] if i < len(chunks)]
-    
-    # ✅ Ensure text is joined properly
-    context_text = " ".join(retrieved_chunks).replace("\n", " ")  # Ensure smooth formatting
-
-    # ✅ Ensure proper LLM response handling
-    response = ollama.chat(
-        model="llama3.1",
-        messages=[
-            {"role": "system", "content": "You are an AI that provides precise answers based on retrieved document content."},
-            {"role": "user", "content": f"Here is relevant text from the document:\n\n{context_text}\n\nUser Question: {query}\n\nProvide a clear and structured response:"}
-        ]
-    )
-
-    return response["message"]["content"]  # ✅ Return the LLM-generated answer
+    # Same question, same index: no embedding, search or generation at all
+    exact = cache.get_exact(index_path, version, scope, query) if cache else None
+    if exact:
+        yield cached_answer(exact[0], "exact")
+        return
+
+    # Search for top candidates (index & metadata stay in memory between questions), then pack the best k
+    # (identifier lookups skip the query embedding when the lexical index finds them)
+    embed_start = time.perf_counter()
+    query_embedding = None if is_identifier_query(query) else generate_embedding(query)
+    embed_ms = (time.perf_counter() - embed_start) * 1000
+    candidates = retriever.search(query, k * SEARCH_CANDIDATES, doc_ids=doc_ids, query_embedding=query_embedding,
+                                  timings=timings)
+    timings["embed_ms"] = timings.get("embed_ms", 0.0) + embed_ms  # search() returns early if no chunk is in scope
+    if not candidates:
+        timings["total_ms"] = (time.perf_counter() - start) * 1000
+        yield "⚠️ No relevant chunks found in the selected documents."
+        return
+    packed, packing = pack_context(candidates, token_budget, max_chunks=k)
+    timings.update(packing)
+    chunk_ids = [chunk["faiss_id"] for chunk in packed]
+
+    # A near-duplicate question that was answered from the same chunks
+    similar = cache.get_similar(version, scope, chunk_ids, query_embedding) if cache and query_embedding is not None else None
+    if similar:
+        yield cached_answer(similar, "semantic")
+        return
+
+    timings["answer_cache"] = "miss" if cache else "off"
+    pieces = []
+    llm_start = time.perf_counter()
+    for piece in get_client().chat_stream(model=CHAT_MODEL, messages=build_messages(query, packed)):
+        if "ttft_ms" not in timings and piece:
+            timings["ttft_ms"] = (time.perf_counter() - start) * 1000
+        pieces.append(piece)
+        yield piece
+    timings["llm_ms"] = (time.perf_counter() - llm_start) * 1000
+    timings["total_ms"] = (time.perf_counter() - start) * 1000
+    telemetry.count("answers", source="llm")
+    telemetry.observe("answer", timings["total_ms"] / 1000)
+    if "ttft_ms" in timings:
+        telemetry.observe("answer_ttft", timings["ttft_ms"] / 1000)
+
+    if cache and pieces:  # Only complete answers (a closed generator never gets here)
+        cache.put(index_path, version, scope, query, chunk_ids, query_embedding, "".join(pieces))
+
+def search_faiss(query, k=5, index_path=DEFAULT_INDEX_PATH, doc_ids=None, token_budget=CONTEXT_TOKEN_BUDGET):
+    """Searches FAISS for relevant document chunks (optionally only in `doc_ids`) and generates an LLM response."""
+    if get_retriever(index_path).ntotal == 0:
+        return ["⚠️ No embeddings found in FAISS. Ensure embeddings were generated correctly."]
+    return "".join(stream_answer(query, k, index_path, doc_ids, token_budget))  # ✅ The LLM-generated answer
@@ -0,0 +1,24 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Run from anywhere
+
+# No on-disk caches unless a test asks for one (read when the modules are imported)
+os.environ["EMBEDDING_CACHE_PATH"] = ""
+os.environ["ANSWER_CACHE_PATH"] = ""
+
+from tests.fake_ollama import FakeOllamaServer
+from modules.ollama_client import OllamaClient
+
+
+@pytest.fixture
+def server():
+    with FakeOllamaServer() as server:
+        yield server
+
+@pytest.fixture
+def client(server):
+    client = OllamaClient(host=server.url, max_in_flight=2, backoff=0.01)
+    yield client
+    client.close()
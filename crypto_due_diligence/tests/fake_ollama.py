@@ -0,0 +1,202 @@
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the Ollama HTTP API so the embedding layer can be exercised offline
+# (by the tests, the pipeline benchmark, or by hand):
+#   python -m tests.fake_ollama --port 11435
+#   OLLAMA_HOST=http://127.0.0.1:11435 python main.py
+
+FAKE_VECTOR_SIZE = 768  # Same width as nomic-embed-text
+
+def fake_embedding(text, dim=FAKE_VECTOR_SIZE):
+    """Deterministic unit-length vector derived from the text's SHA-256."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dim)]
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def fake_answer(messages):
+    """Deterministic chat reply that echoes the last user question."""
+    question = messages[-1]["content"] if messages else ""
+    question = question.rsplit("User Question:", 1)[-1].split("\n", 1)[0].strip()
+    return f"Fake answer to: {question}"
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """Serves the embedding & chat endpoints used by the pipeline."""
+
+    protocol_version = "HTTP/1.1"  # Keep-alive, so clients can reuse pooled connections
+    disable_nagle_algorithm = True  # Headers & body are separate writes: don't wait for delayed ACKs
+
+    def setup(self):
+        super().setup()
+        self.server.record_connection()
+
+    def log_message(self, format, *args):
+        pass  # Keep test/benchmark output quiet
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream_answer(self, payload):
+        """NDJSON stream of the fake answer, one word per line (chunked transfer encoding)."""
+        server = self.server
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send_line(message):
+            line = json.dumps(message).encode("utf-8") + b"\n"
+            self.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+            self.wfile.flush()
+
+        words = fake_answer(payload.get("messages", [])).split(" ")
+        try:
+            for i, word in enumerate(words):
+                if server.token_latency:
+                    time.sleep(server.token_latency)
+                content = word if i == 0 else " " + word
+                send_line({"model": payload.get("model"), "message": {"role": "assistant", "content": content}, "done": False})
+            send_line({"model": payload.get("model"), "message": {"role": "assistant", "content": ""}, "done": True})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):  # The client stopped reading the answer
+            self.close_connection = True
+
+    def do_POST(self):
+        server = self.server
+        payload = self._read_json()
+        server.record(self.path, payload)
+        server.enter()
+        try:
+            if server.latency:
+                time.sleep(server.latency)
+            if server.should_fail():
+                self._send_json({"error": "fake overload"}, status=503)
+            else:
+                self._respond(payload)
+        finally:
+            server.leave()
+
+    def _respond(self, payload):
+        server = self.server
+        if self.path == "/api/embed":
+            texts = payload.get("input", [])
+            if isinstance(texts, str):
+                texts = [texts]
+            self._send_json({
+                "model": payload.get("model"),
+                "embeddings": [fake_embedding(t, server.dim) for t in texts],
+            })
+        elif self.path == "/api/embeddings":
+            self._send_json({"embedding": fake_embedding(payload.get("prompt", ""), server.dim)})
+        elif self.path == "/api/chat" and payload.get("stream"):
+            self._stream_answer(payload)
+        elif self.path == "/api/chat":
+            self._send_json({
+                "model": payload.get("model"),
+                "message": {"role": "assistant", "content": fake_answer(payload.get("messages", []))},
+                "done": True,
+            })
+        else:
+            self._send_json({"error": f"unsupported endpoint {self.path}"}, status=404)
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    """Threaded fake Ollama server that records every request it receives."""
+
+    daemon_threads = True
+    request_queue_size = 128  # Many pooled clients connecting at once mustn't overflow the listen backlog
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, dim=FAKE_VECTOR_SIZE, fail_first=0, token_latency=0.0):
+        super().__init__((host, port), FakeOllamaHandler)
+        self.latency = latency
+        self.token_latency = token_latency  # Seconds per streamed answer word
+        self.dim = dim
+        self.fail_first = fail_first  # The first N requests get a 503, to exercise client retries
+        self.requests = []
+        self.connections = 0  # TCP connections accepted (pooled clients reuse them)
+        self.in_flight = 0
+        self.max_in_flight = 0  # Most requests ever served at the same time
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def record(self, path, payload):
+        with self._lock:
+            self.requests.append((path, payload))
+
+    def record_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def enter(self):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def should_fail(self):
+        with self._lock:
+            if self.fail_first > 0:
+                self.fail_first -= 1
+                return True
+            return False
+
+    def start(self):
+        """Serves in a background thread; returns self so it can be used inline."""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a deterministic fake Ollama server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request")
+    parser.add_argument("--fail-first", type=int, default=0, help="Answer the first N requests with 503")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Seconds per streamed answer word")
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(args.host, args.port, latency=args.latency, fail_first=args.fail_first,
+                              token_latency=args.token_latency)
+    print(f"🧪 Fake Ollama listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
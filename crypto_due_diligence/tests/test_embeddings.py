@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from modules import embeddings
+from modules.embedding_cache import EmbeddingCache
+from tests.fake_ollama import fake_embedding
+
+
+@pytest.fixture
+def shared_client(server, monkeypatch):
+    """The process-wide client of modules.embeddings, pointed at the fake server."""
+    monkeypatch.setenv("OLLAMA_HOST", server.url)
+    embeddings.reset_client()
+    yield embeddings.get_client()
+    embeddings.reset_client()
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite"))
+    monkeypatch.setattr(embeddings, "get_embedding_cache", lambda: cache)
+    yield cache
+    cache.close()
+
+def embed_requests(server):
+    return [payload for path, payload in server.requests if path == "/api/embed"]
+
+def test_embed_texts_batches(server, shared_client):
+    texts = [f"chunk {i}" for i in range(5)]
+    assert embeddings.embed_texts(texts, batch_size=2, use_cache=False) == [fake_embedding(text) for text in texts]
+    assert sorted(len(payload["input"]) for payload in embed_requests(server)) == [1, 2, 2]  # Sent concurrently
+
+def test_repeated_texts_are_embedded_once(server, shared_client):
+    result = embeddings.embed_texts(["same text", "other", "same  text"], use_cache=False)
+
+    assert result[0] == result[2] == fake_embedding("same text")
+    assert embed_requests(server)[0]["input"] == ["same text", "other"]
+
+def test_cache_hits_skip_ollama(server, shared_client, cache):
+    texts = ["revenue grew", "custody risk"]
+    first = embeddings.embed_texts(texts)
+    requests = len(server.requests)
+    second = embeddings.embed_texts(texts + ["new text"])
+
+    np.testing.assert_allclose(second[:2], first, atol=1e-6)  # Stored as float32
+    assert len(server.requests) == requests + 1
+    assert embed_requests(server)[-1]["input"] == ["new text"]
+    assert cache.hits == 2
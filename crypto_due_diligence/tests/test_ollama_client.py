@@ -0,0 +1,58 @@
+import asyncio
+import ollama
+import pytest
+from tests.fake_ollama import fake_answer, fake_embedding
+
+
+def test_embed_batches_sends_one_request_per_batch(server, client):
+    texts = [f"text {i}" for i in range(10)]
+    embeddings = client.embed_batches(texts, model="nomic-embed-text", batch_size=4)
+
+    assert embeddings == [fake_embedding(text) for text in texts]  # In input order
+    assert sorted(len(payload["input"]) for path, payload in server.requests if path == "/api/embed") == [2, 4, 4]
+
+def test_transient_failures_are_retried(server, client):
+    server.fail_first = 2
+    embeddings = client.embed_batches(["a", "b"], model="nomic-embed-text", batch_size=2)
+
+    assert embeddings == [fake_embedding("a"), fake_embedding("b")]
+    assert len(server.requests) == 3
+    assert client.stats()["embed"]["retries"] == 2
+
+def test_gives_up_after_max_retries(server, client):
+    server.fail_first = client.max_retries + 1
+    with pytest.raises(ollama.ResponseError):
+        client.embed(model="nomic-embed-text", input=["a"])
+    assert len(server.requests) == client.max_retries + 1
+    assert client.stats()["embed"]["errors"] == 1
+
+def test_requests_in_flight_are_limited(server, client):
+    server.latency = 0.05
+    client.embed_batches([f"text {i}" for i in range(12)], model="nomic-embed-text", batch_size=1)
+
+    assert len(server.requests) == 12
+    assert server.max_in_flight == client.max_in_flight
+
+def test_in_flight_limit_applies_to_async_callers(server, client):
+    server.latency = 0.05
+
+    async def embed_concurrently():
+        await asyncio.gather(*(client.embed_async("nomic-embed-text", [f"text {i}"]) for i in range(8)))
+
+    asyncio.run(embed_concurrently())
+    assert server.max_in_flight <= client.max_in_flight
+
+def test_chat_stream_yields_the_answer_piece_by_piece(server, client):
+    messages = [{"role": "user", "content": "User Question: What is MiCA?"}]
+    pieces = list(client.chat_stream(model="llama3.1", messages=messages))
+
+    assert len(pieces) > 1
+    assert "".join(pieces) == fake_answer(messages)
+    assert client.stats()["chat_stream"]["requests"] == 1
+
+def test_chat_stream_retries_before_the_first_piece(server, client):
+    server.fail_first = 1
+    messages = [{"role": "user", "content": "User Question: Who audits the reserves?"}]
+
+    assert "".join(client.chat_stream(model="llama3.1", messages=messages)) == fake_answer(messages)
+    assert client.stats()["chat_stream"]["retries"] == 1
@@ -0,0 +1,132 @@
+import faiss
+import pytest
+from modules import embeddings, vector_database
+from modules.chunk_store import ChunkStore, chunk_store_path_for
+from modules.vector_database import CorpusIndex, FaissRetriever, rebuild_faiss_index, stream_answer
+from tests.fake_ollama import fake_embedding
+
+DIM = 16
+
+
+def make_chunks(doc_id, count, version=""):
+    texts = [f"{doc_id} chunk {i} {version}".strip() for i in range(count)]
+    return [{"text": text, "chunk_id": i, "embedding": fake_embedding(text, DIM)} for i, text in enumerate(texts)]
+
+def search_docs(retriever, k=20, doc_ids=None):
+    chunks = retriever.search("chunk", k=k, doc_ids=doc_ids, query_embedding=fake_embedding("chunk", DIM))
+    return sorted((chunk["doc_id"], chunk["text"]) for chunk in chunks)
+
+def removed_ids(index_path):
+    store = ChunkStore(chunk_store_path_for(index_path))
+    try:
+        return store.removed_ids()
+    finally:
+        store.close()
+
+@pytest.fixture
+def index_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_database, "INDEX_DELTA_MIN", 4)
+    monkeypatch.setattr(vector_database, "VECTOR_SIZE", DIM)
+    return str(tmp_path / "corpus.index")
+
+@pytest.fixture
+def retriever(index_path):
+    with CorpusIndex(index_path):  # Writes the (empty) index file
+        pass
+    retriever = FaissRetriever(index_path, mmap=False)
+    yield retriever
+    retriever.store.close()
+
+@pytest.fixture
+def shared_client(server, monkeypatch):
+    monkeypatch.setenv("OLLAMA_HOST", server.url)
+    embeddings.reset_client()
+    yield embeddings.get_client()
+    embeddings.reset_client()
+
+def test_added_documents_are_searchable_before_compaction(index_path, retriever):
+    with CorpusIndex(index_path) as corpus:
+        corpus.add_document("a", make_chunks("a", 2))
+        corpus.add_document("b", make_chunks("b", 1))
+        assert not corpus.needs_compaction()
+    assert faiss.read_index(index_path).ntotal == 0  # Still pending in the chunk store
+
+    assert [doc for doc, _ in search_docs(retriever)] == ["a", "a", "b"]
+    assert retriever.ntotal == 3
+
+def test_removed_documents_disappear_before_and_after_compaction(index_path, retriever):
+    with CorpusIndex(index_path) as corpus:
+        corpus.add_document("a", make_chunks("a", 3))
+        corpus.add_document("b", make_chunks("b", 2))  # 5 pending: compacted on save
+    assert faiss.read_index(index_path).ntotal == 5
+
+    with CorpusIndex(index_path) as corpus:
+        assert corpus.remove_document("a") == 3
+    assert [doc for doc, _ in search_docs(retriever)] == ["b", "b"]  # Tombstones skipped
+    assert retriever.ntotal == 2
+
+    with CorpusIndex(index_path) as corpus:
+        corpus.add_document("c", make_chunks("c", 4))
+        assert corpus.needs_compaction()
+    assert faiss.read_index(index_path).ntotal == 6
+    assert not removed_ids(index_path)
+    assert [doc for doc, _ in search_docs(retriever)] == ["b", "b", "c", "c", "c", "c"]
+
+def test_replacing_a_document_keeps_only_the_new_chunks(index_path, retriever):
+    with CorpusIndex(index_path) as corpus:
+        corpus.add_document("a", make_chunks("a", 3, "v1"))
+        corpus.save()
+        corpus.add_document("a", make_chunks("a", 2, "v2"))
+        assert corpus.documents() == {"a": 2}
+
+    assert search_docs(retriever) == [("a", "a chunk 0 v2"), ("a", "a chunk 1 v2")]
+
+def test_doc_ids_filter(index_path, retriever):
+    with CorpusIndex(index_path) as corpus:
+        corpus.add_document("a", make_chunks("a", 4))  # Compacted into the file
+        corpus.save()
+        corpus.add_document("b", make_chunks("b", 2))  # Pending
+
+    assert [doc for doc, _ in search_docs(retriever, doc_ids=["b"])] == ["b", "b"]
+    assert [doc for doc, _ in search_docs(retriever, doc_ids=["a"])] == ["a"] * 4
+    assert search_docs(retriever, doc_ids=["missing"]) == []
+
+def test_answer_without_chunks_in_scope_skips_the_llm(index_path, retriever, server, shared_client):
+    with CorpusIndex(index_path) as corpus:
+        corpus.add_document("a", make_chunks("a", 2))
+    timings = {}
+
+    answer = "".join(stream_answer("what about revenue", index_path=index_path, doc_ids=["missing"], timings=timings))
+    assert answer.startswith("⚠️ No relevant chunks")
+    assert not any(path == "/api/chat" for path, _ in server.requests)
+    assert "embed_ms" in timings
+
+def test_corpus_with_every_document_removed_is_empty(index_path, retriever, server, shared_client):
+    with CorpusIndex(index_path) as corpus:
+        corpus.add_document("a", make_chunks("a", 4))
+        corpus.save()
+        corpus.remove_document("a")
+
+    assert search_docs(retriever) == []
+    assert retriever.ntotal == 0
+    assert "".join(stream_answer("what about revenue", index_path=index_path)).startswith("⚠️ No embeddings found")
+    assert not server.requests
+
+def test_hnsw_corpus_keeps_tombstones_until_rebuilt(index_path, retriever):
+    with CorpusIndex(index_path) as corpus:
+        corpus.add_document("a", make_chunks("a", 3))
+        corpus.add_document("b", make_chunks("b", 3))
+    rebuild_faiss_index("hnsw", index_path)
+
+    with CorpusIndex(index_path) as corpus:
+        corpus.remove_document("a")
+        corpus.add_document("c", make_chunks("c", 4))  # Compaction can't drop a's vectors from HNSW
+        corpus.save()
+        assert sorted(corpus.store.removed_ids()) == [1, 2, 3]
+    assert faiss.read_index(index_path).ntotal == 10
+    assert [doc for doc, _ in search_docs(retriever)] == ["b"] * 3 + ["c"] * 4
+
+    rebuild_faiss_index("hnsw", index_path)
+    assert faiss.read_index(index_path).ntotal == 7
+    assert not removed_ids(index_path)
+    assert [doc for doc, _ in search_docs(retriever)] == ["b"] * 3 + ["c"] * 4